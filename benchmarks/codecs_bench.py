@@ -0,0 +1,57 @@
+"""
+Compares registered codecs on representative payloads.
+
+Usage: python benchmarks/codecs_bench.py [--number N]
+"""
+
+import argparse
+import timeit
+
+from typing import Any, Dict
+
+from jarpc.codecs import registered_codecs
+
+PAYLOADS: Dict[str, Any] = {
+    "small": {"message": "hello", "count": 1},
+    "records": {
+        "users": [
+            {"id": i, "name": f"user-{i}", "email": f"user{i}@example.com", "age": i}
+            for i in range(100)
+        ]
+    },
+    "numbers": {"values": [i * 1.5 for i in range(10000)]},
+    "text": {"text": "lorem ipsum dolor sit amet " * 4000},
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=1000, help="runs per payload")
+
+    args = parser.parse_args()
+
+    print(
+        f"{'payload':<10} {'codec':<10} {'size':>10} "
+        f"{'encode us':>10} {'decode us':>10}"
+    )
+
+    for payload_name, payload in PAYLOADS.items():
+        for codec in registered_codecs():
+            try:
+                encoded = codec.encode(payload)
+            except Exception as e:
+                print(f"{payload_name:<10} {codec.name:<10} unsupported: {e}")
+                continue
+
+            encode = timeit.timeit(lambda: codec.encode(payload), number=args.number)
+            decode = timeit.timeit(lambda: codec.decode(encoded), number=args.number)
+
+            print(
+                f"{payload_name:<10} {codec.name:<10} {len(encoded):>10} "
+                f"{encode / args.number * 1e6:>10.2f} "
+                f"{decode / args.number * 1e6:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import asyncio
+
+from typing import AsyncIterator, Dict
+
+from jarpc import Client, Request, Server
+
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+
+COMMAND_COUNT = 0
+
+
+async def count(req: Request, limit: int) -> AsyncIterator[Dict[str, int]]:
+    """Yields numbers one by one, each number is sent as soon as it is ready."""
+
+    for i in range(limit):
+        await asyncio.sleep(0.2)
+
+        yield {"number": i}
+
+
+async def main() -> None:
+    client = Client("streaming", default_timeout=5)
+    server = Server("streaming")
+
+    server.add_command(COMMAND_COUNT, count)
+
+    asyncio.create_task(client.start((REDIS_HOST, REDIS_PORT)))
+    asyncio.create_task(server.start((REDIS_HOST, REDIS_PORT)))
+
+    await client.wait_until_ready()
+    await server.wait_until_ready()
+
+    async for response in client.call(COMMAND_COUNT, {"limit": 5}):
+        print(f"{response.node} [{response.sequence}]: {response.data}")
+
+    server.close()
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Command line interface.
+
+Usage: python -m jarpc {serve,bench} ...
+"""
+
+import argparse
+
+from typing import Optional, Sequence
+
+from . import bench, launcher
+
+__all__ = ("main",)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="jarpc")
+    parser.add_argument(
+        "command",
+        choices=("serve", "bench"),
+        help="serve runs server in worker processes, bench runs benchmark",
+    )
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        launcher.main(args.args)
+    else:
+        bench.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,24 @@
 
 import abc
 
-from typing import Any, Dict, Generator, List, Optional, Tuple, Union
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+from .cache import TTLCache
+from .codecs import Codec
+from .compression import Compressor
 from .enums import StatusCode
+from .protocol import VERSION, TraceContext
 from .response import Response
 from .types import CommandType
 
@@ -27,6 +42,7 @@ __all__ = (
     "ABCConnection",
     "ABCClient",
     "ABCServer",
+    "ABCTransport",
 )
 
 
@@ -35,7 +51,8 @@ class ResponsesIterator(abc.ABC):
     Provides access to command responses.
 
     Instances can be awaited to get all responses at once or used as async iterator to
-    process responses as soon as they arrive.
+    process responses as soon as they arrive. Using them as async context manager
+    closes them on exit.
     """
 
     @abc.abstractmethod
@@ -50,6 +67,15 @@ class ResponsesIterator(abc.ABC):
     async def __anext__(self) -> Response:
         ...
 
+    def close(self) -> None:
+        """Stops receiving responses, responses received later are dropped."""
+
+    async def __aenter__(self) -> "ResponsesIterator":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.close()
+
 
 class ABCConnection(abc.ABC):
     """RPC Connection."""
@@ -64,7 +90,7 @@ class ABCConnection(abc.ABC):
 
     @abc.abstractmethod
     async def start(
-        self, redis_address: Union[Tuple[str, int], str], **kwargs: Any
+        self, redis_address: Union[Tuple[str, int], str, None] = None, **kwargs: Any
     ) -> None:
         """Starts processing messages."""
 
@@ -82,16 +108,42 @@ class ABCClient(ABCConnection):
         command_index: int,
         data: Optional[Dict[str, Any]] = None,
         timeout: Optional[float] = None,
-        expect_responses: int = 0,
+        expect_responses: Optional[Union[int, str]] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        nodes: Optional[Sequence[str]] = None,
+        mode: str = "all",
+        wait_sent: bool = False,
     ) -> ResponsesIterator:
         """Calls command by index."""
 
+    @abc.abstractmethod
+    async def send(
+        self,
+        command_index: int,
+        data: Optional[Dict[str, Any]] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        nodes: Optional[Sequence[str]] = None,
+        mode: str = "all",
+    ) -> int:
+        """Sends request without waiting for responses, returns number of receivers."""
+
 
 class ABCServer(ABCConnection):
     """Responds to commands."""
 
     @abc.abstractmethod
-    def add_command(self, index: int, fn: CommandType) -> int:
+    def add_command(
+        self,
+        index: int,
+        fn: CommandType,
+        max_concurrency: Optional[int] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        cache: Optional[TTLCache] = None,
+        executor: Union[str, Executor, None] = None,
+    ) -> int:
         """Registers new command."""
 
     @abc.abstractmethod
@@ -100,6 +152,55 @@ class ABCServer(ABCConnection):
 
     @abc.abstractmethod
     async def reply(
-        self, *, address: Optional[str], status: StatusCode, data: Any
+        self,
+        *,
+        node: str,
+        address: Optional[str],
+        status: StatusCode,
+        data: Any,
+        version: int = VERSION,
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = None,
+        sequence: Optional[int] = None,
+        end_of_stream: bool = True,
+        trace: Optional[TraceContext] = None,
     ) -> None:
-        """Sends response to address."""
+        """Sends response to address of node."""
+
+
+class ABCTransport(abc.ABC):
+    """Delivers encoded messages between nodes."""
+
+    @abc.abstractmethod
+    async def connect(self, node: str, channels: List[str]) -> None:
+        """
+        Connects and starts receiving messages sent to channels. Raises OSError if
+        connection cannot be established.
+        """
+
+    @abc.abstractmethod
+    def messages(self) -> AsyncIterator[bytes]:
+        """Yields received messages until connection is lost."""
+
+    @abc.abstractmethod
+    async def send(
+        self, batch: Sequence[Tuple[str, str, bytes]]
+    ) -> List[Union[int, Exception]]:
+        """
+        Sends batch of (command, channel, message) tuples. command is "publish" for
+        messages sent to channel subscribers and "push" for messages appended to work
+        queue list. Returns number of receivers (or queue length) or exception for
+        every message.
+        """
+
+    @abc.abstractmethod
+    async def pop(self, key: str) -> bytes:
+        """Waits for message in work queue list and removes it."""
+
+    @abc.abstractmethod
+    def disconnect(self) -> None:
+        """Releases resources after connection was lost."""
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Closes transport, messages iterator stops."""
@@ -0,0 +1,247 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark of request/response round trips.
+
+Client calls echo command of N servers running in the same process and measures
+throughput, latency, traffic and CPU time for every combination of payload size, codec
+and number of servers. Loopback transport measures overhead of library itself, redis
+transport includes network and redis-server (its CPU time is not counted).
+
+Usage: python -m jarpc.bench [--transport redis] [--servers 1,4] [--json] ...
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import uuid
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from .client import Client
+from .connection import Connection
+from .server import Server
+from .transport import LoopbackHub, LoopbackTransport
+
+__all__ = ("run_case", "percentile", "main")
+
+ECHO_COMMAND = 0
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Returns q-th (0 < q <= 1) percentile of sorted values."""
+
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+
+    return sorted_values[index]
+
+
+async def _echo(request: Any, payload: Any) -> Any:
+    return payload
+
+
+async def run_case(
+    *,
+    transport: str = "loopback",
+    redis_address: Union[Tuple[str, int], str] = ("localhost", 6379),
+    servers: int = 1,
+    payload_size: int = 64,
+    codec: str = "marshal",
+    compression: str = "none",
+    calls: int = 1000,
+    concurrency: int = 16,
+    timeout: int = 10,
+) -> Dict[str, Any]:
+    """Runs single benchmark case and returns results."""
+
+    if transport not in ("loopback", "redis"):
+        raise ValueError('transport should be "loopback" or "redis"')
+
+    # unique name isolates runs sharing redis server
+    name = f"bench-{uuid.uuid4().hex}"
+    hub = LoopbackHub()
+
+    def connection_kwargs() -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"codec": codec, "compression": compression}
+        if transport == "loopback":
+            kwargs["transport"] = LoopbackTransport(hub)
+
+        return kwargs
+
+    client = Client(name, default_timeout=timeout, **connection_kwargs())
+    nodes = [
+        Server(name, max_concurrency=None, **connection_kwargs())
+        for _ in range(servers)
+    ]
+
+    for server in nodes:
+        server.add_command(ECHO_COMMAND, _echo)
+
+    connections: List[Connection] = [client, *nodes]
+
+    for connection in connections:
+        if transport == "loopback":
+            asyncio.create_task(connection.start())
+        else:
+            asyncio.create_task(connection.start(redis_address))
+
+    for connection in connections:
+        await connection.wait_until_ready()
+
+    data = {"payload": "x" * payload_size}
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(count: int, record: bool) -> None:
+        nonlocal errors
+
+        for _ in range(count):
+            started = time.perf_counter()
+            responses = await client.call(ECHO_COMMAND, data)
+            elapsed = time.perf_counter() - started
+
+            if len(responses) != servers:
+                errors += 1
+
+            if record:
+                latencies.append(elapsed)
+
+    try:
+        # warm up connections and caches
+        await worker(min(calls, 100), False)
+
+        bytes_before = sum(c.stats.get("bytes_sent", 0) for c in connections)
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+
+        per_worker, extra = divmod(calls, concurrency)
+        await asyncio.gather(
+            *[worker(per_worker + (i < extra), True) for i in range(concurrency)]
+        )
+
+        wall = time.perf_counter() - wall_before
+        cpu = time.process_time() - cpu_before
+        traffic = sum(c.stats.get("bytes_sent", 0) for c in connections) - bytes_before
+    finally:
+        for connection in connections:
+            connection.close()
+
+    latencies.sort()
+
+    return {
+        "transport": transport,
+        "servers": servers,
+        "payload_size": payload_size,
+        "codec": codec,
+        "compression": compression,
+        "calls": calls,
+        "concurrency": concurrency,
+        "errors": errors,
+        "calls_per_second": calls / wall if wall else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "latency_p999_ms": percentile(latencies, 0.999) * 1000,
+        "bytes_per_call": traffic / calls if calls else 0.0,
+        "cpu_us_per_call": cpu / calls * 1e6 if calls else 0.0,
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def _str_list(value: str) -> List[str]:
+    return value.split(",")
+
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    print(
+        f"{'servers':>7} {'payload':>8} {'codec':<8} {'calls/s':>9} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'bytes/call':>10} "
+        f"{'cpu us':>8} {'errors':>6}"
+    )
+
+    for r in results:
+        print(
+            f"{r['servers']:>7} {r['payload_size']:>8} {r['codec']:<8} "
+            f"{r['calls_per_second']:>9.0f} {r['latency_p50_ms']:>8.3f} "
+            f"{r['latency_p99_ms']:>8.3f} {r['latency_p999_ms']:>8.3f} "
+            f"{r['bytes_per_call']:>10.0f} {r['cpu_us_per_call']:>8.1f} "
+            f"{r['errors']:>6}"
+        )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m jarpc.bench", description="Benchmark of jarpc round trips."
+    )
+    parser.add_argument(
+        "--transport", choices=("loopback", "redis"), default="loopback"
+    )
+    parser.add_argument("--redis-address", default="redis://localhost:6379")
+    parser.add_argument(
+        "--servers", type=_int_list, default=[1, 4], help="comma separated"
+    )
+    parser.add_argument(
+        "--payload-sizes", type=_int_list, default=[64, 4096], help="comma separated"
+    )
+    parser.add_argument(
+        "--codecs", type=_str_list, default=["marshal"], help="comma separated"
+    )
+    parser.add_argument("--compression", default="none")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+
+    args = parser.parse_args(argv)
+
+    async def run() -> List[Dict[str, Any]]:
+        results = []
+
+        for servers, payload_size, codec in itertools.product(
+            args.servers, args.payload_sizes, args.codecs
+        ):
+            results.append(
+                await run_case(
+                    transport=args.transport,
+                    redis_address=args.redis_address,
+                    servers=servers,
+                    payload_size=payload_size,
+                    codec=codec,
+                    compression=args.compression,
+                    calls=args.calls,
+                    concurrency=args.concurrency,
+                )
+            )
+
+        return results
+
+    results = asyncio.run(run())
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Caching of command results."""
+
+import collections
+import time
+
+from typing import Any, Dict, Hashable, Tuple
+
+from .constants import NoValue
+
+__all__ = ("TTLCache", "make_key")
+
+
+def make_key(data: Any) -> Hashable:
+    """
+    Returns hashable key equal for equal command arguments. Dict key order does not
+    matter, values of different types never match (1 and True are different keys).
+    Raises TypeError if data contains unhashable objects of unknown types.
+    """
+
+    if isinstance(data, dict):
+        items = [(make_key(k), make_key(v)) for k, v in data.items()]
+        # keys of different types cannot be compared, repr gives stable order
+        return dict, tuple(sorted(items, key=repr))
+
+    if isinstance(data, (list, tuple)):
+        return type(data), tuple(make_key(item) for item in data)
+
+    if isinstance(data, (set, frozenset)):
+        return type(data), frozenset(make_key(item) for item in data)
+
+    hash(data)
+
+    return type(data), data
+
+
+class TTLCache:
+    """
+    Mapping with limited size and lifetime of entries. Least recently used entries
+    are evicted once max_size is reached.
+    """
+
+    __slots__ = ("_ttl", "_max_size", "_entries", "hits", "misses", "evictions")
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        if ttl <= 0:
+            raise ValueError("ttl should be > 0")
+
+        if max_size < 1:
+            raise ValueError("max_size should be >= 1")
+
+        self._ttl = ttl
+        self._max_size = max_size
+
+        # key -> (expiration time, value), ordered from least recently used
+        self._entries: "collections.OrderedDict[Hashable, Tuple[float, Any]]" = (
+            collections.OrderedDict()
+        )
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Returns cached value or NoValue if it is missing or expired."""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return NoValue
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+
+            self.misses += 1
+            return NoValue
+
+        self._entries.move_to_end(key)
+
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable = NoValue) -> None:
+        """Removes entry with given key or all entries if key is not given."""
+
+        if key is NoValue:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns size, hits, misses and evictions counters."""
+
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} size={len(self._entries)} "
+            f"ttl={self._ttl} max_size={self._max_size}>"
+        )
@@ -15,19 +15,224 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
+import functools
+import heapq
 import logging
+import math
 import time
 import uuid
 
-from typing import Any, Dict, Generator, List, Optional
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+)
 
 from .abc import ABCClient, ResponsesIterator
+from .cache import TTLCache, make_key
+from .codecs import Codec
+from .compression import Compressor
 from .connection import Connection
+from .constants import NoValue
+from .enums import StatusCode
+from .errors import RPCBusyError
+from .interceptors import CallContext
+from .metrics import Metrics
+from .protocol import Frame
 from .response import Response
-from .types import TypedQueue
 
 log = logging.getLogger(__name__)
 
+EXPECT_RESPONSES_AUTO = "auto"
+
+CALL_MODE_ALL = "all"
+CALL_MODE_ANY = "any"
+
+# seconds, calls time out up to this much later than requested
+TIMER_RESOLUTION = 0.01
+
+
+def _check_expect_responses(expect_responses: Optional[Union[int, str]]) -> None:
+    if expect_responses is None or expect_responses == EXPECT_RESPONSES_AUTO:
+        return
+
+    if not isinstance(expect_responses, int):
+        raise ValueError(
+            f'expect_responses should be integer or "{EXPECT_RESPONSES_AUTO}"'
+        )
+
+    if expect_responses < 0:
+        raise ValueError("expect_responses should be >= 0")
+
+
+def _check_call_target(
+    nodes: Optional[Sequence[str]], mode: str
+) -> Optional[Sequence[str]]:
+    """Validates nodes and mode of call. Returns nodes without duplicates."""
+
+    if mode not in (CALL_MODE_ALL, CALL_MODE_ANY):
+        raise ValueError(f'mode should be "{CALL_MODE_ALL}" or "{CALL_MODE_ANY}"')
+
+    if nodes is None:
+        return None
+
+    if mode == CALL_MODE_ANY:
+        raise ValueError(f'nodes cannot be used in "{CALL_MODE_ANY}" mode')
+
+    if not nodes:
+        raise ValueError("nodes should not be empty")
+
+    # drop duplicates, every node should receive request once
+    return list(dict.fromkeys(nodes))
+
+
+def _log_send_error(sent: "asyncio.Future[int]") -> None:
+    if sent.cancelled():
+        return
+
+    error = sent.exception()
+    if error is not None:
+        log.warning(
+            "could not send request: %s: %s", error.__class__.__name__, str(error)
+        )
+
+
+class _CallLimiter:
+    """
+    Limits number of calls waiting for responses. Calls above the limit wait for
+    their turn in order they were made.
+    """
+
+    __slots__ = ("_free", "_waiters", "_space_waiters", "queued")
+
+    def __init__(self, size: int):
+        self._free = size
+
+        self._waiters: Deque["asyncio.Future[None]"] = collections.deque()
+        # futures of wait_for_space callers
+        self._space_waiters: List["asyncio.Future[None]"] = []
+
+        # calls waiting for their turn, counted before they start waiting
+        self.queued = 0
+
+    def can_acquire(self) -> bool:
+        return self._free > 0 and not self.queued
+
+    def try_acquire(self) -> bool:
+        if not self.can_acquire():
+            return False
+
+        self._free -= 1
+
+        return True
+
+    async def acquire(self) -> None:
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+
+        try:
+            await fut
+        except BaseException:
+            # slot could be handed over right before cancellation
+            if fut.done() and not fut.cancelled():
+                self.release()
+
+            raise
+
+    def release(self) -> None:
+        # slot is handed over to the first waiting call
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+
+        self._free += 1
+
+        for fut in self._space_waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+        self._space_waiters = []
+
+    async def wait_for_space(self) -> None:
+        while not self.can_acquire():
+            fut = asyncio.get_running_loop().create_future()
+            self._space_waiters.append(fut)
+
+            await fut
+
+
+class _CallSlot:
+    """Place of call in limited number of calls waiting for responses."""
+
+    __slots__ = ("_limiter", "_acquired", "_queued", "_released")
+
+    def __init__(self, limiter: _CallLimiter):
+        self._limiter = limiter
+        self._acquired = limiter.try_acquire()
+        self._released = False
+
+        self._queued = not self._acquired
+        if self._queued:
+            limiter.queued += 1
+
+    @property
+    def acquired(self) -> bool:
+        return self._acquired
+
+    def _dequeue(self) -> None:
+        if self._queued:
+            self._queued = False
+            self._limiter.queued -= 1
+
+    async def acquire(self) -> bool:
+        """Waits for free slot. Returns False if call finished before that."""
+
+        if self._acquired:
+            return True
+
+        if self._released:
+            return False
+
+        try:
+            await self._limiter.acquire()
+        finally:
+            self._dequeue()
+
+        if self._released:
+            self._limiter.release()
+            return False
+
+        self._acquired = True
+
+        return True
+
+    def release(self) -> None:
+        if self._released:
+            return
+
+        self._released = True
+
+        self._dequeue()
+
+        if self._acquired:
+            self._limiter.release()
+
 
 class ResponsesWithTimeout(ResponsesIterator):
     """Provides access to command responses for limited time."""
@@ -37,35 +242,83 @@ class ResponsesWithTimeout(ResponsesIterator):
         "_address",
         "_timeout",
         "_expect_responses",
+        "_receivers",
+        "_nodes",
         "_responses_seen",
-        "_start_time",
-        "_queue",
+        "_nodes_done",
+        "_loop",
+        "_deadline",
+        "_buffer",
+        "_waiter",
+        "_closed",
+        "_slot",
+        "_sent",
+        "_tick",
     )
 
     def __init__(
         self,
         client: "Client",
-        queue: TypedQueue[Response],
         address: str,
         timeout: float,
-        expect_responses: Optional[int] = None,
+        expect_responses: Optional[Union[int, str]] = None,
+        receivers: "Optional[asyncio.Future[int]]" = None,
+        nodes: Optional[Sequence[str]] = None,
+        slot: Optional[_CallSlot] = None,
+        sent: "Optional[asyncio.Future[int]]" = None,
     ):
+        """
+        Registers listener of responses sent to address in client, it is removed once
+        every expected node responded, timeout passes or iterator is closed.
+
+        If expect_responses is "auto", number of expected responses is taken from
+        receivers future that should resolve to number of servers that received
+        request. nodes should be set for requests sent to specific nodes.
+
+        slot is released once iterator stops listening.
+
+        If sent future is given, it is awaited before returning responses and errors
+        of sending request are raised.
+        """
+
         self._client = client
-        self._queue = queue
         self._address = address
         self._timeout = timeout
 
-        if expect_responses is None:
-            expect_responses = 0
+        _check_expect_responses(expect_responses)
+
+        self._receivers: "Optional[asyncio.Future[int]]" = None
+        self._nodes = nodes
 
-        if expect_responses < 0:
-            raise ValueError("expect_responses should be >= 0")
+        # None means responses are collected until timeout
+        self._expect_responses: Optional[int] = None
 
-        self._expect_responses = expect_responses
+        if expect_responses == EXPECT_RESPONSES_AUTO:
+            if receivers is None:
+                raise ValueError("receivers are required for automatic mode")
+
+            self._receivers = receivers
+            receivers.add_done_callback(self._wake)
+        elif isinstance(expect_responses, int) and expect_responses != 0:
+            self._expect_responses = expect_responses
 
         self._responses_seen = 0
+        # number of nodes that sent their last response
+        self._nodes_done = 0
+
+        self._buffer: Deque[Response] = collections.deque()
+        self._waiter: "Optional[asyncio.Future[None]]" = None
+        self._closed = False
+
+        self._slot = slot
+        self._sent = sent
 
-        self._start_time = time.time()
+        self._loop = asyncio.get_running_loop()
+        self._deadline = self._loop.time() + timeout
+        # bucket of timer wheel, set by wheel
+        self._tick = 0
+
+        client._add_listener(address, self)
 
     def __await__(self) -> Generator[Any, None, List[Response]]:
         """Returns all responses once they are ready."""
@@ -79,25 +332,109 @@ class ResponsesWithTimeout(ResponsesIterator):
         return self
 
     async def __anext__(self) -> Response:
-        if (
-            self._expect_responses != 0
-            and self._expect_responses == self._responses_seen
-        ):
-            raise StopAsyncIteration
+        if self._sent is not None:
+            sent = self._sent
+            self._sent = None
+
+            try:
+                await asyncio.shield(sent)
+            except Exception:
+                self.close()
+                raise
+
+        while True:
+            if self._receivers is not None and self._receivers.done():
+                self._count_receivers()
+
+            if self._completed:
+                self.close()
+
+                raise StopAsyncIteration
+
+            # responses received before timeout are returned even if it passed
+            if self._buffer:
+                resp = self._buffer.popleft()
+
+                if resp.end_of_stream:
+                    self._nodes_done += 1
+
+                # closing message of stream carries no data
+                if resp._is_stream_end_marker:
+                    continue
+
+                self._responses_seen += 1
+
+                return resp
+
+            if self._closed:
+                raise StopAsyncIteration
+
+            self._waiter = self._loop.create_future()
+
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+    def _count_receivers(self) -> None:
+        assert self._receivers is not None
+
+        receivers = self._receivers
+        self._receivers = None
 
         try:
-            resp = await asyncio.wait_for(
-                self._queue.get(), timeout=self.time_remaining
+            num_receivers = receivers.result()
+        except (Exception, asyncio.CancelledError) as e:
+            # errors of sending are logged by client
+            log.debug(
+                "unable to get number of receivers, waiting for timeout: %s: %s",
+                e.__class__.__name__,
+                str(e),
+            )
+        else:
+            self._expect_responses = self._client._count_responders(
+                num_receivers, self._nodes
             )
-        except asyncio.TimeoutError:
-            raise StopAsyncIteration
 
-        self._responses_seen += 1
+    def _put(self, response: Response) -> None:
+        self._buffer.append(response)
+        self._wake()
 
-        return resp
+    def _wake(self, *args: Any) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _expire(self) -> None:
+        """Stops listening for responses, already received ones are kept."""
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._client._remove_listener(self._address)
+        self._wake()
+
+        if self._slot is not None:
+            self._slot.release()
+
+    def close(self) -> None:
+        self._expire()
+        self._buffer.clear()
+
+    @property
+    def _completed(self) -> bool:
+        """True if every expected node finished responding."""
+
+        return (
+            self._expect_responses is not None
+            and self._expect_responses <= self._nodes_done
+        )
+
+    @property
+    def _pending(self) -> int:
+        """Number of received responses that were not yielded yet."""
 
-    def __del__(self) -> None:
-        self._client._remove_queue(self._address)
+        return len(self._buffer)
 
     @property
     def responses_seen(self) -> int:
@@ -109,7 +446,7 @@ class ResponsesWithTimeout(ResponsesIterator):
     def time_remaining(self) -> float:
         """Remaining time until iterator is closed."""
 
-        return self._timeout - time.time() + self._start_time
+        return self._deadline - self._loop.time()
 
     def __repr__(self) -> str:
         return (
@@ -119,14 +456,265 @@ class ResponsesWithTimeout(ResponsesIterator):
         )
 
 
+class _TimerWheel:
+    """
+    Expires listeners of calls in batches. Deadlines are rounded up to resolution,
+    listeners expiring in the same tick share bucket and single loop timer is
+    scheduled for the earliest bucket. Closed listeners are removed from their bucket,
+    empty buckets stay until their tick passes.
+    """
+
+    __slots__ = ("_resolution", "_buckets", "_ticks", "_handle", "_handle_tick")
+
+    def __init__(self, resolution: float = TIMER_RESOLUTION):
+        self._resolution = resolution
+
+        self._buckets: Dict[int, Set[ResponsesWithTimeout]] = {}
+        # heap of bucket ticks
+        self._ticks: List[int] = []
+
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._handle_tick = 0
+
+    def add(self, listener: ResponsesWithTimeout) -> None:
+        tick = math.ceil(listener._deadline / self._resolution)
+        listener._tick = tick
+
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = set()
+            heapq.heappush(self._ticks, tick)
+
+        bucket.add(listener)
+
+        if self._handle is None or tick < self._handle_tick:
+            self._schedule(tick)
+
+    def discard(self, listener: ResponsesWithTimeout) -> None:
+        bucket = self._buckets.get(listener._tick)
+        if bucket is not None:
+            bucket.discard(listener)
+
+    def _schedule(self, tick: int) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+
+        self._handle_tick = tick
+        self._handle = asyncio.get_running_loop().call_at(
+            tick * self._resolution, self._expire
+        )
+
+    def _expire(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        # timer could fire slightly before its time
+        now = max(self._handle_tick, math.floor(loop.time() / self._resolution))
+
+        self._handle = None
+
+        while self._ticks and self._ticks[0] <= now:
+            for listener in self._buckets.pop(heapq.heappop(self._ticks)):
+                listener._expire()
+
+        if self._ticks:
+            self._schedule(self._ticks[0])
+
+    def clear(self) -> None:
+        """Expires all listeners immediately."""
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        buckets = list(self._buckets.values())
+
+        self._buckets = {}
+        self._ticks = []
+
+        for bucket in buckets:
+            for listener in bucket:
+                listener._expire()
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+
+class CachingResponses(ResponsesIterator):
+    """
+    Passes responses through and stores them in cache once every expected node
+    responded successfully.
+    """
+
+    __slots__ = ("_responses", "_cache", "_key", "_received", "_failed")
+
+    def __init__(self, responses: ResponsesWithTimeout, cache: TTLCache, key: Any):
+        self._responses = responses
+        self._cache = cache
+        self._key = key
+
+        self._received: List[Response] = []
+        self._failed = False
+
+    def __await__(self) -> Generator[Any, None, List[Response]]:
+        """Returns all responses once they are ready."""
+
+        async def coro() -> List[Response]:
+            return [resp async for resp in self]
+
+        return coro().__await__()
+
+    def __aiter__(self) -> "CachingResponses":
+        return self
+
+    async def __anext__(self) -> Response:
+        try:
+            resp = await self._responses.__anext__()
+        except StopAsyncIteration:
+            # partial results of timed out calls are not cached
+            if self._received and not self._failed and self._responses._completed:
+                self._cache.set(self._key, self._received)
+
+            raise
+
+        # errors are not cached
+        if resp.status == StatusCode.SUCCESS:
+            self._received.append(resp)
+        else:
+            self._failed = True
+
+        return resp
+
+    def close(self) -> None:
+        self._responses.close()
+
+
+class CachedResponses(ResponsesIterator):
+    """Iterates over responses taken from cache."""
+
+    __slots__ = ("_responses", "_index")
+
+    def __init__(self, responses: List[Response]):
+        self._responses = responses
+        self._index = 0
+
+    def __await__(self) -> Generator[Any, None, List[Response]]:
+        """Returns all cached responses."""
+
+        async def coro() -> List[Response]:
+            return list(self._responses)
+
+        return coro().__await__()
+
+    def __aiter__(self) -> "CachedResponses":
+        return self
+
+    async def __anext__(self) -> Response:
+        if self._index >= len(self._responses):
+            raise StopAsyncIteration
+
+        self._index += 1
+
+        return self._responses[self._index - 1]
+
+
+class _Flight:
+    """Call shared by identical concurrent calls."""
+
+    __slots__ = ("responses", "done", "error", "task", "_waiters")
+
+    def __init__(self) -> None:
+        self.responses: List[Response] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+
+        # task reading responses of call
+        self.task: "Optional[asyncio.Task[None]]" = None
+
+        # every caller waits on its own future, cancelling one does not affect others
+        self._waiters: List["asyncio.Future[None]"] = []
+
+    def add(self, response: Response) -> None:
+        self.responses.append(response)
+        self._notify()
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        waiters = self._waiters
+        self._waiters = []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self) -> None:
+        """Waits for new response or end of call."""
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            await waiter
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+
+class SharedResponses(ResponsesIterator):
+    """Responses of call shared with identical concurrent calls."""
+
+    __slots__ = ("_flight", "_index")
+
+    def __init__(self, flight: _Flight):
+        self._flight = flight
+        self._index = 0
+
+    def __await__(self) -> Generator[Any, None, List[Response]]:
+        """Returns all responses once they are ready."""
+
+        async def coro() -> List[Response]:
+            return [resp async for resp in self]
+
+        return coro().__await__()
+
+    def __aiter__(self) -> "SharedResponses":
+        return self
+
+    async def __anext__(self) -> Response:
+        # responses received before this iterator was created are replayed
+        while self._index >= len(self._flight.responses):
+            if self._flight.done:
+                if self._flight.error is not None:
+                    raise self._flight.error
+
+                raise StopAsyncIteration
+
+            await self._flight.wait()
+
+        self._index += 1
+
+        return self._flight.responses[self._index - 1]
+
+
 class EmptyResponses(ResponsesIterator):
-    """Behaves the same way as ResponsesWithTimeout, except it is empty."""
+    """
+    Behaves the same way as ResponsesWithTimeout, except it is empty. If sent is
+    given, error of sending is raised once iteration starts.
+    """
+
+    __slots__ = ("_sent",)
+
+    def __init__(self, sent: "Optional[asyncio.Future[int]]" = None):
+        self._sent = sent
 
     def __await__(self) -> Generator[Any, None, List[Response]]:
         """Returns empty list of responses."""
 
         async def coro() -> List[Response]:
-            return []
+            return [resp async for resp in self]
 
         return coro().__await__()
 
@@ -134,6 +722,12 @@ class EmptyResponses(ResponsesIterator):
         return self
 
     async def __anext__(self) -> Response:
+        if self._sent is not None:
+            sent = self._sent
+            self._sent = None
+
+            await asyncio.shield(sent)
+
         raise StopAsyncIteration
 
 
@@ -147,73 +741,518 @@ class Client(Connection, ABCClient):
         self,
         *args: Any,
         default_timeout: Optional[int] = None,
-        default_expect_responses: Optional[int] = None,
+        default_expect_responses: Optional[Union[int, str]] = EXPECT_RESPONSES_AUTO,
+        single_flight: bool = False,
+        max_pending_calls: Optional[int] = None,
+        max_queued_calls: Optional[int] = None,
         **kwargs: Any,
     ):
+        """
+        single_flight makes identical concurrent calls (same command, arguments and
+        call options) share single request, every caller receives the same
+        responses.
+
+        max_pending_calls limits number of calls waiting for responses. Requests of
+        calls above this limit are sent once earlier calls finish, time spent waiting
+        counts towards timeout. Up to max_queued_calls calls (max_pending_calls by
+        default) wait for their turn, call raises RPCBusyError above that. Use
+        wait_for_call_slot to wait until call can be sent at once.
+        """
+
+        if max_pending_calls is not None and max_pending_calls < 1:
+            raise ValueError("max_pending_calls should be >= 1")
+
+        if max_queued_calls is not None and max_queued_calls < 0:
+            raise ValueError("max_queued_calls should be >= 0")
+
         super().__init__(*args, **kwargs)
 
         self._default_timeout = default_timeout
         self._default_expect_responses = default_expect_responses
 
-        self._listeners: Dict[str, TypedQueue[Response]] = {}
+        self._listeners: Dict[str, ResponsesWithTimeout] = {}
+        self._timers = _TimerWheel()
+
+        self._caches: Dict[int, TTLCache] = {}
+
+        self._single_flight = single_flight
+        self._flights: Dict[Any, _Flight] = {}
+
+        self._call_limiter: Optional[_CallLimiter] = None
+        if max_pending_calls is not None:
+            self._call_limiter = _CallLimiter(max_pending_calls)
+
+        if max_queued_calls is None:
+            max_queued_calls = max_pending_calls or 0
+
+        self._max_queued_calls = max_queued_calls
+
+        if self._metrics is not None:
+            self._metrics.add_collector(self._collect_client_metrics)
+
+    def _channels(self) -> List[str]:
+        # responses are sent to personal channel of client
+        return super()._channels() + [self._node_channel(self._node)]
 
-    def _make_response(self, data: Any) -> Optional[Response]:
-        return Response.from_data(data)
+    def _make_response(self, frame: Frame) -> Optional[Response]:
+        if frame.address is None:
+            log.debug("ignoring response without address from node %s", frame.node)
+            return None
+
+        return Response.from_frame(frame, self._find_codec(frame.codec))
 
     async def _handle_response(self, response: Response) -> None:
         log.info("received response from node %s", response.node)
 
-        queue = self._listeners.get(response._address)
-        if queue is None:
+        listener = self._listeners.get(response._address)
+        if listener is None:
+            # call timed out or was closed
+            self._stats["late_responses"] += 1
+
             log.debug("ignoring response from node %s", response.node)
             return
 
-        await queue.put(response)
+        listener._put(response)
+
+    def _count_responders(
+        self, num_receivers: int, nodes: Optional[Sequence[str]] = None
+    ) -> int:
+        """
+        Returns number of responses to expect from given number of receivers of
+        request sent to all servers or to given nodes.
+        """
+
+        # Slient receives own requests, but does not respond to them
+        if nodes is None:
+            if self._name in self._channels():
+                num_receivers -= 1
+        elif self._node in nodes:
+            num_receivers -= 1
+
+        return max(num_receivers, 0)
+
+    def close(self) -> None:
+        """Closes connection and finishes all calls waiting for responses."""
+
+        self._timers.clear()
+
+        super().close()
 
-    def _add_queue(self, address: str, queue: TypedQueue[Response]) -> None:
-        self._listeners[address] = queue
+    async def wait_for_call_slot(self) -> None:
+        """
+        Waits until number of calls waiting for responses is below max_pending_calls,
+        so the next call is sent at once. Returns immediately if calls are not
+        limited.
+        """
+
+        if self._call_limiter is not None:
+            await self._call_limiter.wait_for_space()
 
-    def _remove_queue(self, address: str) -> None:
-        self._listeners.pop(address, None)
+    def _collect_client_metrics(self, metrics: Metrics) -> None:
+        depths = [listener._pending for listener in self._listeners.values()]
+
+        metrics.set_gauge("listeners", len(depths))
+        metrics.set_gauge("listener_queue_depth", sum(depths))
+        metrics.set_gauge("listener_queue_max_depth", max(depths, default=0))
+
+        for command_index, cache in self._caches.items():
+            metrics.set_gauge("cache_size", len(cache), command=command_index)
+            metrics.set_counter("cache_hits_total", cache.hits, command=command_index)
+            metrics.set_counter(
+                "cache_misses_total", cache.misses, command=command_index
+            )
+            metrics.set_counter(
+                "cache_evictions_total", cache.evictions, command=command_index
+            )
+
+    def cache_command(
+        self, command_index: int, ttl: float, max_size: int = 1024
+    ) -> None:
+        """
+        Caches responses of command for ttl seconds, up to max_size results of
+        different calls are kept. Results are only cached if every server responded
+        successfully before timeout. Should only be used for commands without side
+        effects.
+
+        Cached responses are shared between calls, their data should not be modified.
+        """
+
+        self._caches[command_index] = TTLCache(ttl, max_size)
+
+    def uncache_command(self, command_index: int) -> None:
+        """Stops caching responses of command."""
+
+        self._caches.pop(command_index, None)
+
+    def invalidate_cache(
+        self, command_index: Optional[int] = None, data: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Removes cached responses of command called with data, all responses of command
+        if data is not given, or responses of all commands if command_index is not
+        given. Only calls without nodes argument are invalidated by data.
+        """
+
+        if command_index is None:
+            for command_cache in self._caches.values():
+                command_cache.invalidate()
+
+            return
+
+        cache = self._caches.get(command_index)
+        if cache is None:
+            return
+
+        if data is None:
+            cache.invalidate()
+        else:
+            for mode in (CALL_MODE_ALL, CALL_MODE_ANY):
+                cache.invalidate(make_key((data, None, mode)))
+
+    @property
+    def cache_stats(self) -> Dict[int, Dict[str, int]]:
+        """Cache counters of every cached command."""
+
+        return {index: cache.stats() for index, cache in self._caches.items()}
+
+    async def _run_flight(
+        self, key: Any, flight: _Flight, responses: ResponsesIterator
+    ) -> None:
+        error = None
+
+        try:
+            async for resp in responses:
+                flight.add(resp)
+        except Exception as e:
+            error = e
+        finally:
+            # calls made after this point send new request
+            self._flights.pop(key, None)
+
+            flight.finish(error)
+
+    @staticmethod
+    def _flight_done(task: "asyncio.Task[None]") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            log.error("error running shared call", exc_info=task.exception())
+
+    def _add_listener(self, address: str, listener: ResponsesWithTimeout) -> None:
+        self._listeners[address] = listener
+        self._timers.add(listener)
+
+    def _remove_listener(self, address: str) -> None:
+        listener = self._listeners.pop(address, None)
+        if listener is not None:
+            self._timers.discard(listener)
+
+    async def send(
+        self,
+        command_index: int,
+        data: Optional[Dict[str, Any]] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        nodes: Optional[Sequence[str]] = None,
+        mode: str = CALL_MODE_ALL,
+    ) -> int:
+        """
+        Sends request without waiting for responses. Returns number of servers that
+        received it, length of work queue in "any" mode. Errors of sending are
+        raised. Arguments have the same meaning as in call.
+        """
+
+        log.info("sending command %d", command_index)
+
+        if self._metrics is not None:
+            self._metrics.inc("calls_total", command=command_index)
+
+        if data is None:
+            data = {}
+
+        nodes = _check_call_target(nodes, mode)
+
+        request_codec = self._resolve_codec(codec)
+        request_compressor = self._resolve_compressor(compression)
+
+        if self._interceptors:
+            return await self._intercept_call(
+                CallContext(command_index, data, nodes, mode),
+                None,
+                request_codec,
+                request_compressor,
+            )
+
+        return await self._send_request(
+            command_index,
+            data,
+            None,
+            request_codec,
+            request_compressor,
+            nodes=nodes,
+            queued=mode == CALL_MODE_ANY,
+        )
+
+    async def _send_admitted(
+        self, slot: _CallSlot, send: Coroutine[Any, Any, int]
+    ) -> int:
+        try:
+            admitted = await slot.acquire()
+        except BaseException:
+            send.close()
+            raise
+
+        if not admitted:
+            log.debug("call finished before it was sent")
+
+            send.close()
+            return 0
+
+        return await send
+
+    async def _intercept_call(
+        self,
+        context: CallContext,
+        address: Optional[str],
+        codec: Codec,
+        compressor: Compressor,
+    ) -> int:
+        async def send(context: CallContext) -> int:
+            return await self._send_request(
+                context.command_index,
+                context.data,
+                address,
+                codec,
+                compressor,
+                nodes=context.nodes,
+                queued=context.mode == CALL_MODE_ANY,
+                trace=context.trace,
+                deadline=context.deadline,
+            )
+
+        call: Callable[[CallContext], Awaitable[int]] = send
+        for interceptor in reversed(self._interceptors):
+            call = functools.partial(interceptor.send, call_next=call)
+
+        return await call(context)
 
     def call(
         self,
         command_index: int,
         data: Optional[Dict[str, Any]] = None,
         timeout: Optional[float] = None,
-        expect_responses: Optional[int] = None,
+        expect_responses: Optional[Union[int, str]] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        nodes: Optional[Sequence[str]] = None,
+        mode: str = CALL_MODE_ALL,
+        wait_sent: bool = False,
     ) -> ResponsesIterator:
         """
         Calls command and returns received responses. Skips response processing
         completely if timeout is None.
+
+        expect_responses stops iteration early once given number of nodes finished
+        responding, 0 means waiting until timeout. "auto" uses number of servers that
+        received request, note that it only works if every server responds: commands
+        that return None without calling request.reply cause waiting until timeout.
+
+        Commands implemented as async generators stream their results, every item is
+        yielded as a separate response as soon as it arrives.
+
+        nodes limits request to servers with given node identifiers, other servers do
+        not receive it. In "auto" mode only nodes that received request are awaited.
+
+        mode "all" sends request to every server. Mode "any" puts request into work
+        queue, it is processed by exactly one of servers that is not busy, "auto"
+        expects single response in this mode. Queued requests stay in queue until some
+        server takes them.
+
+        codec and compression override default codec and compression algorithm of
+        client for this call.
+
+        Requests with timeout carry deadline, servers drop them without running command
+        once it passes.
+
+        Errors of sending request are logged, wait_sent makes returned iterator raise
+        them instead (calls without timeout log them as well, their iterators are
+        rarely consumed). Use send method to send request without waiting for
+        responses and get number of receivers.
+
+        RPCBusyError is raised if send queue is full, send method waits for free space
+        instead.
+
+        Responses stop being received once every expected node responded or timeout
+        passes. Iterators that are not consumed completely should be closed to stop
+        receiving earlier, using them as async context manager does it on exit.
         """
 
         log.info("sending command %d", command_index)
 
+        if self._metrics is not None:
+            self._metrics.inc("calls_total", command=command_index)
+
         if data is None:
             data = {}
 
-        payload = {"n": self._node, "c": command_index, "d": data}
-
         if timeout is None:
             timeout = self._default_timeout
 
+        if expect_responses is None:
+            expect_responses = self._default_expect_responses
+
+        _check_expect_responses(expect_responses)
+
+        nodes = _check_call_target(nodes, mode)
+        queued = mode == CALL_MODE_ANY
+
+        cache = self._caches.get(command_index)
+        cache_key: Any = NoValue
+
+        if cache is not None and timeout is not None:
+            try:
+                cache_key = make_key((data, nodes, mode))
+            except TypeError:
+                log.debug("arguments of command %d cannot be cached", command_index)
+            else:
+                cached = cache.get(cache_key)
+                if cached is not NoValue:
+                    return CachedResponses(cached)
+
+        flight_key: Any = NoValue
+
+        if self._single_flight and timeout is not None:
+            try:
+                flight_key = make_key(
+                    (
+                        command_index,
+                        data,
+                        timeout,
+                        expect_responses,
+                        codec,
+                        compression,
+                        nodes,
+                        mode,
+                        wait_sent,
+                    )
+                )
+            except TypeError:
+                log.debug("arguments of command %d cannot be shared", command_index)
+            else:
+                flight = self._flights.get(flight_key)
+                if flight is not None:
+                    self._stats["calls_coalesced"] += 1
+
+                    return SharedResponses(flight)
+
+        if len(self._send_buffer) >= self._max_send_queue:
+            # creating task for every call would make queue unbounded
+            self._stats["calls_rejected"] += 1
+
+            raise RPCBusyError("send queue is full")
+
+        limiter = self._call_limiter
+        if (
+            timeout is not None
+            and limiter is not None
+            and not limiter.can_acquire()
+            and limiter.queued >= self._max_queued_calls
+        ):
+            self._stats["calls_rejected"] += 1
+
+            raise RPCBusyError("too many pending calls")
+
+        request_codec = self._resolve_codec(codec)
+        request_compressor = self._resolve_compressor(compression)
+
+        address = None
+        deadline = None
         if timeout is not None:
             address = uuid.uuid4().hex
-            payload["a"] = address
+            deadline = time.time() + timeout
+
+        # calls without timeout do not wait for responses and are not limited
+        slot = None
+        if timeout is not None and self._call_limiter is not None:
+            slot = _CallSlot(self._call_limiter)
 
-            queue: TypedQueue[Response] = TypedQueue()
-            self._add_queue(address, queue)
+        sent: "asyncio.Future[int]"
 
-        asyncio.create_task(self._send_request(payload))
+        if self._interceptors or (slot is not None and not slot.acquired):
+            send: Coroutine[Any, Any, int]
+
+            if self._interceptors:
+                context = CallContext(
+                    command_index, data, nodes, mode, deadline=deadline
+                )
+
+                send = self._intercept_call(
+                    context, address, request_codec, request_compressor
+                )
+            else:
+                send = self._send_request(
+                    command_index,
+                    data,
+                    address,
+                    request_codec,
+                    request_compressor,
+                    nodes=nodes,
+                    queued=queued,
+                    deadline=deadline,
+                )
+
+            if slot is not None and not slot.acquired:
+                send = self._send_admitted(slot, send)
+
+            sent = asyncio.create_task(send)
+        else:
+            # request is handed to writer directly without creating task
+            sent = self._enqueue_request(
+                command_index,
+                data,
+                address,
+                request_codec,
+                request_compressor,
+                nodes=nodes,
+                queued=queued,
+                deadline=deadline,
+            )
+
+        if not wait_sent or timeout is None:
+            sent.add_done_callback(_log_send_error)
 
         if timeout is None:
-            return EmptyResponses()
+            return EmptyResponses(sent if wait_sent else None)
+
+        assert address is not None
+
+        if queued and expect_responses == EXPECT_RESPONSES_AUTO:
+            # queued request is taken by single server
+            expect_responses = 1
 
-        return ResponsesWithTimeout(
+        responses = ResponsesWithTimeout(
             self,
-            queue,
             address,
             timeout,
-            expect_responses or self._default_expect_responses,
+            expect_responses,
+            receivers=sent,
+            nodes=nodes,
+            slot=slot,
+            sent=sent if wait_sent else None,
         )
+
+        result: ResponsesIterator = responses
+
+        if cache is not None and cache_key is not NoValue:
+            result = CachingResponses(responses, cache, cache_key)
+
+        if flight_key is not NoValue:
+            flight = _Flight()
+            self._flights[flight_key] = flight
+
+            flight.task = asyncio.create_task(
+                self._run_flight(flight_key, flight, result)
+            )
+            flight.task.add_done_callback(self._flight_done)
+
+            return SharedResponses(flight)
+
+        return result
@@ -0,0 +1,182 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Message body codecs.
+
+Every message carries id of codec used for body, so nodes using different codecs can
+talk to each other as long as both sides have codec registered. Ids below 128 are
+reserved for library codecs, 255 is used for loads/dumps pair given to Connection.
+"""
+
+import json
+import marshal
+import pickle
+
+from typing import Any, Dict, List, Union
+
+from .types import Deserializer, Serializer
+
+__all__ = (
+    "MARSHAL",
+    "PICKLE",
+    "JSON",
+    "MSGPACK",
+    "ORJSON",
+    "CUSTOM",
+    "Codec",
+    "Encoded",
+    "register_codec",
+    "get_codec",
+    "registered_codecs",
+)
+
+MARSHAL = 0
+PICKLE = 1
+JSON = 2
+MSGPACK = 3
+ORJSON = 4
+
+CUSTOM = 255
+
+
+class Codec:
+    """
+    Pair of functions used to encode and decode message bodies.
+
+    accepts_buffer should be True if loads is able to decode memoryview, this saves a
+    copy of message body.
+    """
+
+    __slots__ = ("id", "name", "_loads", "_dumps", "_accepts_buffer")
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        loads: Deserializer,
+        dumps: Serializer,
+        accepts_buffer: bool = False,
+    ):
+        if not 0 <= id <= 255:
+            raise ValueError("codec id should be in range [0, 255]")
+
+        self.id = id
+        self.name = name
+
+        self._loads = loads
+        self._dumps = dumps
+        self._accepts_buffer = accepts_buffer
+
+    def encode(self, data: Any) -> bytes:
+        encoded = self._dumps(data)
+        if isinstance(encoded, str):
+            encoded = encoded.encode()
+
+        return encoded
+
+    def decode(self, body: Union[bytes, memoryview]) -> Any:
+        if self._accepts_buffer or isinstance(body, bytes):
+            return self._loads(body)  # type: ignore
+
+        return self._loads(bytes(body))
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} id={self.id} name={self.name}>"
+
+
+class Encoded:
+    """Data already encoded with codec of message, it is sent as is."""
+
+    __slots__ = ("body",)
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} size={len(self.body)}>"
+
+
+_codecs_by_id: Dict[int, Codec] = {}
+_codecs_by_name: Dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    """Registers codec globally. Raises ValueError if id or name is already used."""
+
+    if codec.id in _codecs_by_id:
+        raise ValueError(f"codec with id {codec.id} already registered")
+
+    if codec.name in _codecs_by_name:
+        raise ValueError(f"codec with name {codec.name} already registered")
+
+    _codecs_by_id[codec.id] = codec
+    _codecs_by_name[codec.name] = codec
+
+
+def get_codec(key: Union[int, str, Codec]) -> Codec:
+    """Returns registered codec by id or name. Raises ValueError if not found."""
+
+    if isinstance(key, Codec):
+        return key
+
+    if isinstance(key, int):
+        codec = _codecs_by_id.get(key)
+    else:
+        codec = _codecs_by_name.get(key)
+
+    if codec is None:
+        raise ValueError(f"codec {key!r} is not registered")
+
+    return codec
+
+
+def registered_codecs() -> List[Codec]:
+    """Returns list of registered codecs."""
+
+    return list(_codecs_by_id.values())
+
+
+def _pickle_dumps(data: Any) -> bytes:
+    # protocol 5 is available since python 3.8
+    return pickle.dumps(data, protocol=min(5, pickle.HIGHEST_PROTOCOL))
+
+
+register_codec(Codec(MARSHAL, "marshal", marshal.loads, marshal.dumps, True))
+# NOTE: pickle is only safe if every node is trusted
+register_codec(Codec(PICKLE, "pickle", pickle.loads, _pickle_dumps, True))
+register_codec(Codec(JSON, "json", json.loads, json.dumps))
+
+try:
+    import msgpack
+except ImportError:
+    pass
+else:
+
+    def _msgpack_loads(body: bytes) -> Any:
+        return msgpack.unpackb(body, raw=False)
+
+    def _msgpack_dumps(data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)  # type: ignore
+
+    register_codec(Codec(MSGPACK, "msgpack", _msgpack_loads, _msgpack_dumps, True))
+
+try:
+    import orjson
+except ImportError:
+    pass
+else:
+    register_codec(Codec(ORJSON, "orjson", orjson.loads, orjson.dumps, True))
@@ -0,0 +1,148 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Message body compression.
+
+Id of compression algorithm is stored in lower bits of message flags, 0 means body is
+not compressed. zlib is always available, lz4 and zstd are available when lz4 and
+zstandard packages are importable.
+"""
+
+import zlib
+
+from typing import Callable, Dict, List, Union
+
+__all__ = (
+    "NONE",
+    "ZLIB",
+    "LZ4",
+    "ZSTD",
+    "Compressor",
+    "get_compressor",
+    "registered_compressors",
+)
+
+NONE = 0
+ZLIB = 1
+LZ4 = 2
+ZSTD = 3
+
+# ids have to fit into flag bits
+_MAX_ID = 3
+
+
+class Compressor:
+    """Pair of functions used to compress and decompress message bodies."""
+
+    __slots__ = ("id", "name", "_compress", "_decompress")
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        compress: Callable[[bytes], bytes],
+        decompress: Callable[[Union[bytes, memoryview]], bytes],
+    ):
+        if not 0 <= id <= _MAX_ID:
+            raise ValueError(f"compressor id should be in range [0, {_MAX_ID}]")
+
+        self.id = id
+        self.name = name
+
+        self._compress = compress
+        self._decompress = decompress
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def decompress(self, data: Union[bytes, memoryview]) -> bytes:
+        return self._decompress(data)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} id={self.id} name={self.name}>"
+
+
+_compressors_by_id: Dict[int, Compressor] = {}
+_compressors_by_name: Dict[str, Compressor] = {}
+
+
+def _register_compressor(compressor: Compressor) -> None:
+    _compressors_by_id[compressor.id] = compressor
+    _compressors_by_name[compressor.name] = compressor
+
+
+def get_compressor(key: Union[int, str, Compressor]) -> Compressor:
+    """Returns available compressor by id or name. Raises ValueError if not found."""
+
+    if isinstance(key, Compressor):
+        return key
+
+    if isinstance(key, int):
+        compressor = _compressors_by_id.get(key)
+    else:
+        compressor = _compressors_by_name.get(key)
+
+    if compressor is None:
+        raise ValueError(f"compressor {key!r} is not available")
+
+    return compressor
+
+
+def registered_compressors() -> List[Compressor]:
+    """Returns list of available compressors."""
+
+    return list(_compressors_by_id.values())
+
+
+def _identity(data: Union[bytes, memoryview]) -> bytes:
+    return bytes(data)
+
+
+def _zlib_compress(data: bytes) -> bytes:
+    # fastest level, large payloads are usually compressed well enough
+    return zlib.compress(data, 1)
+
+
+_register_compressor(Compressor(NONE, "none", _identity, _identity))
+_register_compressor(Compressor(ZLIB, "zlib", _zlib_compress, zlib.decompress))
+
+try:
+    import lz4.frame
+except ImportError:
+    pass
+else:
+    _register_compressor(
+        Compressor(LZ4, "lz4", lz4.frame.compress, lz4.frame.decompress)
+    )
+
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+
+    def _zstd_compress(data: bytes) -> bytes:
+        compressed: bytes = zstandard.ZstdCompressor().compress(data)
+
+        return compressed
+
+    def _zstd_decompress(data: Union[bytes, memoryview]) -> bytes:
+        decompressed: bytes = zstandard.ZstdDecompressor().decompress(data)
+
+        return decompressed
+
+    _register_compressor(Compressor(ZSTD, "zstd", _zstd_compress, _zstd_decompress))
@@ -16,38 +16,66 @@
 
 
 import asyncio
+import collections
 import logging
 import uuid
 
-from typing import Any, Mapping, Optional, Tuple, Union
-
-import aioredis
-
-from .abc import ABCConnection
-from .enums import MessageType
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from .abc import ABCConnection, ABCTransport
+from .codecs import CUSTOM, MARSHAL, Codec, Encoded, get_codec
+from .compression import NONE, ZLIB, Compressor, get_compressor
+from .constants import NoValue
+from .enums import MessageType, StatusCode
+from .errors import RPCError, RPCParsingError
+from .interceptors import Interceptor
+from .metrics import Metrics
+from .protocol import (
+    FLAG_END_OF_STREAM,
+    FLAG_STREAM,
+    Frame,
+    TraceContext,
+    decode_frame,
+    encode_frame,
+    encode_legacy_frame,
+)
 from .request import Request
 from .response import Response
+from .transport import PUBLISH, PUSH, RedisTransport
 from .types import Deserializer, Serializer
 
 log = logging.getLogger(__name__)
 
 
-_payload_value_to_type = {b"0": MessageType.REQUEST, b"1": MessageType.RESPONSE}
-_payload_type_to_value = {v: k for k, v in _payload_value_to_type.items()}
-
-
 class Connection(ABCConnection):
 
     __slots__ = (
         "_name",
         "_node",
         "_ready",
-        "_loads",
-        "_dumps",
-        "_sub",
-        "_pub",
+        "_codec",
+        "_custom_codec",
+        "_compressor",
+        "_compression_threshold",
+        "_transport",
         "_reconnect",
         "_closed",
+        "_max_batch_size",
+        "_max_batch_bytes",
+        "_max_batch_delay",
+        "_max_send_queue",
+        "_send_buffer",
+        "_send_buffer_bytes",
+        "_writer",
+        "_writer_waiter",
+        "_space_waiters",
+        "_stats",
+        "_background_tasks",
+        "_durable",
+        "_stream_max_len",
+        "_stream_read_count",
+        "_metrics",
+        "_interceptors",
     )
 
     def __init__(
@@ -57,32 +85,132 @@ class Connection(ABCConnection):
         dumps: Optional[Serializer] = None,
         node: Optional[str] = None,
         reconnect: bool = True,
+        max_batch_size: int = 512,
+        max_batch_bytes: int = 1024 * 1024,
+        max_batch_delay: float = 0,
+        max_send_queue: int = 8192,
+        codec: Union[int, str, Codec] = MARSHAL,
+        compression: Union[int, str, Compressor] = ZLIB,
+        compression_threshold: int = 64 * 1024,
+        durable: bool = False,
+        stream_max_len: int = 10000,
+        stream_read_count: int = 100,
+        transport: Optional[ABCTransport] = None,
+        metrics: bool = False,
+        interceptors: Sequence[Interceptor] = (),
     ):
+        """
+        Outgoing messages are published in batches of up to max_batch_size messages
+        and max_batch_bytes bytes, batches are sent once per event loop iteration or
+        after max_batch_delay seconds. Up to max_send_queue messages wait for sending,
+        senders are paused when this limit is reached.
+
+        durable, stream_max_len and stream_read_count configure default redis
+        transport, they are ignored if transport is given.
+
+        metrics enables recording of per-command metrics available as metrics
+        property.
+
+        interceptors are called in given order for every call, received message and
+        handled request.
+        """
+
         self._name = f"jarpc:{name}"
         self._node = uuid.uuid4().hex if node is None else node
         self._reconnect = reconnect
 
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size should be >= 1")
+
+        if max_batch_delay < 0:
+            raise ValueError("max_batch_delay should be >= 0")
+
+        if max_send_queue < 1:
+            raise ValueError("max_send_queue should be >= 1")
+
+        # outgoing messages are buffered and sent in pipelined batches by single
+        # writer task
+        self._max_batch_size = max_batch_size
+        self._max_batch_bytes = max_batch_bytes
+        self._max_batch_delay = max_batch_delay
+        self._max_send_queue = max_send_queue
+
+        self._send_buffer: List[Tuple[str, str, bytes, "asyncio.Future[int]"]] = []
+        self._send_buffer_bytes = 0
+
+        self._writer: Optional["asyncio.Task[None]"] = None
+        # resolved when writer should check buffer
+        self._writer_waiter: "Optional[asyncio.Future[None]]" = None
+        # futures of senders waiting for writer to take messages from full buffer,
+        # each sender has its own one so cancelling it does not affect others
+        self._space_waiters: List["asyncio.Future[None]"] = []
+
+        self._stats: Dict[str, int] = collections.Counter()
+
+        self._metrics: Optional[Metrics] = None
+        if metrics:
+            self._metrics = Metrics({"name": name, "node": self._node})
+            self._metrics.add_collector(self._collect_metrics)
+
+        self._background_tasks: List["asyncio.Task[None]"] = []
+
         self._ready = asyncio.Event()
 
+        self._custom_codec: Optional[Codec] = None
+
         if loads and dumps:
-            self._loads = loads
-            self._dumps = dumps
+            self._custom_codec = Codec(CUSTOM, "custom", loads, dumps)
+            self._codec = self._custom_codec
         elif loads is None and dumps is None:
-            import marshal
-
-            self._loads = marshal.loads
-            self._dumps = marshal.dumps
+            self._codec = get_codec(codec)
         else:
             raise ValueError("You cannot define only one of dumps and loads.")
 
+        # bodies smaller than threshold are never compressed
+        self._compressor = get_compressor(compression)
+        self._compression_threshold = compression_threshold
+
+        if stream_max_len < 1:
+            raise ValueError("stream_max_len should be >= 1")
+
+        if stream_read_count < 1:
+            raise ValueError("stream_read_count should be >= 1")
+
+        # durable connections use redis streams instead of pub/sub channels
+        self._durable = durable
+        self._stream_max_len = stream_max_len
+        self._stream_read_count = stream_read_count
+
+        self._transport = transport
+
+        self._interceptors = list(interceptors)
+
         self._closed = False
 
     async def start(
-        self, redis_address: Union[Tuple[str, int], str], **kwargs: Any
+        self, redis_address: Union[Tuple[str, int], str, None] = None, **kwargs: Any
     ) -> None:
-        """Starts processing messages."""
+        """
+        Starts processing messages. redis_address and kwargs are passed to
+        aioredis.create_pool, they should not be used with custom transport.
+        """
+
+        if self._transport is None:
+            if redis_address is None:
+                raise ValueError("redis_address is required for redis transport")
 
-        pool = await aioredis.create_pool(redis_address, minsize=2, maxsize=2, **kwargs)
+            self._transport = RedisTransport(
+                redis_address,
+                durable=self._durable,
+                stream_max_len=self._stream_max_len,
+                stream_read_count=self._stream_read_count,
+                **kwargs,
+            )
+        elif redis_address is not None or kwargs:
+            raise ValueError("redis_address cannot be used with custom transport")
+
+        # Slient gets same channel from Client and Server
+        channels = list(dict.fromkeys(self._channels()))
 
         first_connection = True
 
@@ -93,9 +221,8 @@ class Connection(ABCConnection):
                 first_connection = False
 
             try:
-                self._sub = await pool.acquire()
-                self._pub = await pool.acquire()
-            except (aioredis.ConnectionClosedError, OSError):
+                await self._transport.connect(self._node, channels)
+            except OSError:
                 if not self._reconnect:
                     raise
 
@@ -107,19 +234,19 @@ class Connection(ABCConnection):
 
                 continue
 
-            await self._sub.execute_pubsub("SUBSCRIBE", self._name)
-
             self._ready.set()
 
-            log.info(f"sub: connected: {self._name}")
-            log.info(f"pub: connected: {self._name}")
+            log.info(f"connected: {', '.join(channels)}")
 
-            await self._handler(self._sub.pubsub_channels[self._name.encode()])
+            self._background_tasks = self._start_background_tasks()
 
-            log.debug("sub: connection lost")
+            await self._handler()
 
-            pool.release(self._sub)
-            pool.release(self._pub)
+            log.debug("connection lost")
+
+            self._cancel_background_tasks()
+
+            self._transport.disconnect()
 
     def run(self, *args: Any, **kwargs: Any) -> None:
         """
@@ -134,48 +261,90 @@ class Connection(ABCConnection):
 
         await self._ready.wait()
 
-    async def _handler(self, channel: aioredis.pubsub.Channel) -> None:
-        while await channel.wait_message():
-            msg = await channel.get()
+    def _channels(self) -> List[str]:
+        """Returns list of channels to subscribe to. Overridable."""
 
-            # TODO: parser
-            message_type_byte = msg[:1]
-            msg_type = _payload_value_to_type.get(
-                message_type_byte, MessageType.UNKNOWN_TYPE
-            )
-            if msg_type == MessageType.UNKNOWN_TYPE:
-                log.warn(f"Unknown payload type: {message_type_byte}")
-                continue
+        return []
 
-            try:
-                data = self._loads(msg[1:])
-            except Exception:
-                # address is unavailable
-                # await self._respond(request.address, StatusCode.BAD_FORMAT)
-
-                log.exception(
-                    "could not deserialize payload. "
-                    "Make sure to use same algorithm on both ends"
-                )
-                continue
+    def _start_background_tasks(self) -> List["asyncio.Task[None]"]:
+        """
+        Starts tasks running alongside message handler, they are cancelled when
+        connection is lost. Overridable.
+        """
+
+        return []
+
+    def _cancel_background_tasks(self) -> None:
+        for task in self._background_tasks:
+            task.cancel()
+
+        self._background_tasks = []
 
-            if msg_type == MessageType.REQUEST:
-                request = self._make_request(data)
-                if request is not None:
-                    await self._handle_request(request)
+    def _queue_key(self) -> str:
+        """Returns name of list used as work queue."""
 
-            elif msg_type == MessageType.RESPONSE:
-                response = self._make_response(data)
-                if response is not None:
-                    await self._handle_response(response)
+        return f"{self._name}:queue"
 
-    def _make_request(self, data: Any) -> Optional[Request]:
-        """Called for creating request from data. Overridable."""
+    def _node_channel(self, node: str) -> str:
+        """Returns name of channel used for messages directed to node."""
+
+        return f"{self._name}:{node}"
+
+    async def _handler(self) -> None:
+        assert self._transport is not None
+
+        async for msg in self._transport.messages():
+            await self._process_message(msg)
+
+    def _receive_frame(self, msg: bytes) -> Optional[Frame]:
+        """
+        Parses received message and passes it through interceptors. Returns None if
+        message is malformed or dropped by interceptor.
+        """
+
+        self._stats["messages_received"] += 1
+        self._stats["bytes_received"] += len(msg)
+
+        try:
+            frame = decode_frame(msg, self._codec)
+        except RPCParsingError as e:
+            self._stats["parse_errors"] += 1
+
+            # address is unavailable, impossible to respond
+            log.warning(f"could not parse message: {e}")
+            return None
+
+        for interceptor in self._interceptors:
+            intercepted = interceptor.receive(frame)
+            if intercepted is None:
+                return None
+
+            frame = intercepted
+
+        return frame
+
+    async def _process_message(self, msg: bytes) -> None:
+        frame = self._receive_frame(msg)
+        if frame is None:
+            return
+
+        if frame.message_type == MessageType.REQUEST:
+            request = self._make_request(frame)
+            if request is not None:
+                await self._handle_request(request)
+
+        elif frame.message_type == MessageType.RESPONSE:
+            response = self._make_response(frame)
+            if response is not None:
+                await self._handle_response(response)
+
+    def _make_request(self, frame: Frame) -> Optional[Request]:
+        """Called for creating request from message. Overridable."""
 
         return None
 
-    def _make_response(self, data: Any) -> Optional[Response]:
-        """Called for creating response from data. Overridable."""
+    def _make_response(self, frame: Frame) -> Optional[Response]:
+        """Called for creating response from message. Overridable."""
 
         return None
 
@@ -185,28 +354,415 @@ class Connection(ABCConnection):
     async def _handle_response(self, response: Response) -> None:
         """Called for handling response. Overridable."""
 
-    async def _send_request(self, payload: Mapping[str, Any]) -> None:
-        """Sends payload of request type."""
+    def add_interceptor(self, interceptor: Interceptor) -> None:
+        """Adds interceptor to the end of chain."""
+
+        self._interceptors.append(interceptor)
+
+    def _resolve_codec(self, codec: Union[int, str, Codec, None]) -> Codec:
+        """Returns codec by id or name, None means default codec of connection."""
+
+        if codec is None:
+            return self._codec
+
+        if codec == CUSTOM and self._custom_codec is not None:
+            return self._custom_codec
+
+        return get_codec(codec)
+
+    def _find_codec(self, codec_id: int) -> Optional[Codec]:
+        """Returns codec of received message or None if it is not supported."""
 
-        await self._send(payload, _payload_type_to_value[MessageType.REQUEST])
+        if codec_id == CUSTOM:
+            return self._custom_codec
 
-    async def _send_response(self, payload: Mapping[str, Any]) -> None:
-        """Sends payload of response type."""
+        try:
+            return get_codec(codec_id)
+        except ValueError:
+            return None
 
-        await self._send(payload, _payload_type_to_value[MessageType.RESPONSE])
+    def _resolve_compressor(
+        self, compression: Union[int, str, Compressor, None]
+    ) -> Compressor:
+        """Returns compressor by id or name, None means default of connection."""
+
+        if compression is None:
+            return self._compressor
+
+        return get_compressor(compression)
+
+    def _encode_body(
+        self, data: Any, codec: Codec, compressor: Compressor
+    ) -> Tuple[bytes, int]:
+        """Encodes and compresses body if needed. Returns body and message flags."""
+
+        body = data.body if isinstance(data, Encoded) else codec.encode(data)
+
+        if compressor.id == NONE or len(body) < self._compression_threshold:
+            return body, 0
+
+        compressed = compressor.compress(body)
+        if len(compressed) >= len(body):
+            return body, 0
+
+        self._stats["messages_compressed"] += 1
+        self._stats["bytes_before_compression"] += len(body)
+        self._stats["bytes_after_compression"] += len(compressed)
+
+        return compressed, compressor.id
+
+    async def _send_request(
+        self,
+        command_index: int,
+        data: Any,
+        address: Optional[str],
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = None,
+        nodes: Optional[Sequence[str]] = None,
+        queued: bool = False,
+        trace: Optional[TraceContext] = None,
+        deadline: Optional[float] = None,
+    ) -> int:
+        """
+        Sends request to all servers or only to given nodes. Returns number of
+        receivers.
+
+        Queued requests are appended to work queue instead, they are picked up by
+        exactly one server. Length of queue is returned for them.
+        """
+
+        frame = self._encode_request(
+            command_index, data, address, codec, compressor, trace, deadline
+        )
+        targets = self._request_targets(nodes, queued)
+
+        if len(targets) == 1:
+            return await self._send(frame, *targets[0])
+
+        receivers = await asyncio.gather(
+            *[self._send(frame, channel, command) for channel, command in targets]
+        )
+
+        return sum(receivers)
+
+    def _enqueue_request(
+        self,
+        command_index: int,
+        data: Any,
+        address: Optional[str],
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = None,
+        nodes: Optional[Sequence[str]] = None,
+        queued: bool = False,
+        deadline: Optional[float] = None,
+    ) -> "asyncio.Future[int]":
+        """
+        Same as _send_request, but buffers request without waiting for free space
+        and returns future of result instead.
+        """
 
-    async def _send(self, payload: Mapping[str, Any], pl_type: bytes) -> None:
-        """Sends payload of given type."""
+        frame = self._encode_request(
+            command_index, data, address, codec, compressor, None, deadline
+        )
+        targets = self._request_targets(nodes, queued)
 
-        encoded = self._dumps(payload)
-        if isinstance(encoded, str):
-            encoded = encoded.encode()
+        if len(targets) == 1:
+            return self._enqueue(frame, *targets[0])
 
-        encoded = pl_type + encoded
+        futures = [
+            self._enqueue(frame, channel, command) for channel, command in targets
+        ]
+        result: "asyncio.Future[int]" = asyncio.get_running_loop().create_future()
 
-        num_listeners = await self._pub.execute("PUBLISH", self._name, encoded)
+        def done(gathered: "asyncio.Future[List[int]]") -> None:
+            if result.done():
+                return
+
+            if gathered.cancelled():
+                result.cancel()
+                return
+
+            error = gathered.exception()
+            if error is None:
+                result.set_result(sum(gathered.result()))
+            else:
+                result.set_exception(error)
+
+        asyncio.gather(*futures).add_done_callback(done)
+
+        return result
+
+    def _encode_request(
+        self,
+        command_index: int,
+        data: Any,
+        address: Optional[str],
+        codec: Optional[Codec],
+        compressor: Optional[Compressor],
+        trace: Optional[TraceContext],
+        deadline: Optional[float],
+    ) -> bytes:
+        if codec is None:
+            codec = self._codec
+
+        if compressor is None:
+            compressor = self._compressor
+
+        body, flags = self._encode_body(data, codec, compressor)
+
+        return encode_frame(
+            MessageType.REQUEST,
+            node=self._node,
+            address=address,
+            body=body,
+            codec=codec.id,
+            command_index=command_index,
+            flags=flags,
+            trace=trace,
+            deadline=deadline,
+        )
+
+    def _request_targets(
+        self, nodes: Optional[Sequence[str]], queued: bool
+    ) -> List[Tuple[str, str]]:
+        """Returns (channel, command) pairs request should be sent with."""
+
+        if queued:
+            return [(self._queue_key(), PUSH)]
+
+        if nodes is None:
+            return [(self._name, PUBLISH)]
+
+        return [(self._node_channel(node), PUBLISH) for node in nodes]
+
+    async def _send_response(
+        self,
+        node: str,
+        address: str,
+        status: StatusCode,
+        data: Any,
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = None,
+        *,
+        sequence: Optional[int] = None,
+        end_of_stream: bool = True,
+        trace: Optional[TraceContext] = None,
+    ) -> None:
+        """Sends response to node. sequence is only set for streamed responses."""
+
+        if codec is None:
+            codec = self._codec
+
+        if compressor is None:
+            compressor = self._compressor
+
+        if data is NoValue:
+            body, flags = b"", 0
+        else:
+            body, flags = self._encode_body(data, codec, compressor)
+
+        if sequence is not None:
+            flags |= FLAG_STREAM
+
+            if end_of_stream:
+                flags |= FLAG_END_OF_STREAM
+
+        frame = encode_frame(
+            MessageType.RESPONSE,
+            node=self._node,
+            address=address,
+            body=body,
+            codec=codec.id,
+            status=status,
+            sequence=sequence or 0,
+            flags=flags,
+            trace=trace,
+        )
+
+        await self._send(frame, self._node_channel(node))
+
+    async def _send_legacy_response(
+        self, address: str, status: StatusCode, data: Any
+    ) -> None:
+        """Sends response using first protocol version to shared channel."""
+
+        payload = {"s": status.value, "n": self._node, "a": address}
+
+        if data is not NoValue:
+            payload["d"] = data
+
+        frame = encode_legacy_frame(MessageType.RESPONSE, payload, self._codec)
+
+        await self._send(frame, self._name)
+
+    async def _send(self, frame: bytes, channel: str, command: str = PUBLISH) -> int:
+        """
+        Sends encoded message to channel. Returns number of clients that received
+        message. If command is "push", message is appended to work queue list named
+        channel and length of list is returned.
+
+        Waits for free space if max_send_queue messages are waiting for sending.
+        """
+
+        while len(self._send_buffer) >= self._max_send_queue and not self._closed:
+            waiter = asyncio.get_running_loop().create_future()
+            self._space_waiters.append(waiter)
+
+            try:
+                await waiter
+            finally:
+                if waiter in self._space_waiters:
+                    self._space_waiters.remove(waiter)
+
+        num_listeners = await self._enqueue(frame, channel, command)
         log.debug(f"delivered to {num_listeners} listeners")
 
+        return num_listeners
+
+    def _enqueue(
+        self, frame: bytes, channel: str, command: str = PUBLISH
+    ) -> "asyncio.Future[int]":
+        """
+        Buffers message for sending without waiting for free space. Returns future
+        resolved to result of sending.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        fut: "asyncio.Future[int]" = loop.create_future()
+
+        if self._closed:
+            fut.set_exception(RPCError("connection closed"))
+            return fut
+
+        self._send_buffer.append((command, channel, frame, fut))
+        self._send_buffer_bytes += len(frame)
+
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+            self._writer.add_done_callback(self._writer_done)
+
+        # writer waits either for first message or for full batch
+        if len(self._send_buffer) == 1 or self._batch_full():
+            self._wake_writer()
+
+        return fut
+
+    def _batch_full(self) -> bool:
+        return (
+            len(self._send_buffer) >= self._max_batch_size
+            or self._send_buffer_bytes >= self._max_batch_bytes
+        )
+
+    def _writer_done(self, task: "asyncio.Task[None]") -> None:
+        # writer is started again by next message
+        if task is self._writer:
+            self._writer = None
+
+        if not task.cancelled() and task.exception() is not None:
+            log.error("writer stopped", exc_info=task.exception())
+
+    def _wake_senders(self) -> None:
+        waiters = self._space_waiters
+        self._space_waiters = []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _wake_writer(self) -> None:
+        if self._writer_waiter is not None and not self._writer_waiter.done():
+            self._writer_waiter.set_result(None)
+
+    async def _wait_writer(self) -> None:
+        self._writer_waiter = asyncio.get_running_loop().create_future()
+
+        try:
+            await self._writer_waiter
+        finally:
+            self._writer_waiter = None
+
+    async def _write(self) -> None:
+        """
+        Publishes buffered messages in batches using single pipeline each. Messages
+        buffered while batch is being sent form the next batch.
+        """
+
+        while True:
+            while not self._send_buffer:
+                await self._wait_writer()
+
+            if self._max_batch_delay and not self._batch_full():
+                try:
+                    await asyncio.wait_for(self._wait_writer(), self._max_batch_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            await self._publish_batch(self._take_batch())
+
+    def _take_batch(self) -> List[Tuple[str, str, bytes, "asyncio.Future[int]"]]:
+        size = 0
+        batch_bytes = 0
+
+        for _, _, frame, _ in self._send_buffer:
+            if size and (
+                size >= self._max_batch_size
+                or batch_bytes + len(frame) > self._max_batch_bytes
+            ):
+                break
+
+            size += 1
+            batch_bytes += len(frame)
+
+        batch = self._send_buffer[:size]
+
+        self._send_buffer = self._send_buffer[size:]
+        self._send_buffer_bytes -= batch_bytes
+
+        self._wake_senders()
+
+        return batch
+
+    async def _publish_batch(
+        self, batch: List[Tuple[str, str, bytes, "asyncio.Future[int]"]]
+    ) -> None:
+        self._stats["flushes"] += 1
+        self._stats["messages_sent"] += len(batch)
+        self._stats["bytes_sent"] += sum(len(frame) for _, _, frame, _ in batch)
+
+        if self._transport is None:
+            self._fail_sends(batch, RPCError("connection is not started"))
+            return
+
+        results: List[Union[int, Exception]]
+
+        try:
+            results = await self._transport.send(
+                [(command, channel, frame) for command, channel, frame, _ in batch]
+            )
+        except asyncio.CancelledError:
+            self._fail_sends(batch, RPCError("connection closed"))
+            raise
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, _, _, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    @staticmethod
+    def _fail_sends(
+        batch: List[Tuple[str, str, bytes, "asyncio.Future[int]"]], error: Exception
+    ) -> None:
+        for _, _, _, fut in batch:
+            if not fut.done():
+                fut.set_exception(error)
+
     def close(self) -> None:
         """Closes connection."""
 
@@ -216,8 +772,43 @@ class Connection(ABCConnection):
 
         self._closed = True
 
-        self._sub.close()
-        self._pub.close()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+        self._fail_sends(self._send_buffer, RPCError("connection closed"))
+
+        self._send_buffer = []
+        self._send_buffer_bytes = 0
+
+        # paused senders fail once they resume
+        self._wake_senders()
+
+        self._cancel_background_tasks()
+
+        if self._transport is not None:
+            self._transport.close()
+
+    def _collect_metrics(self, metrics: Metrics) -> None:
+        for key, value in self._stats.items():
+            metrics.set_counter(f"{key}_total", value)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Connection counters: flushes, messages_sent, bytes_sent, messages_received,
+        bytes_received, parse_errors, messages_compressed, bytes_before_compression,
+        bytes_after_compression, calls_coalesced, calls_rejected, requests_expired,
+        requests_rejected, late_responses.
+        """
+
+        return dict(self._stats)
+
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        """Metrics registry, None if metrics are disabled."""
+
+        return self._metrics
 
     @property
     def name(self) -> str:
@@ -231,5 +822,13 @@ class Connection(ABCConnection):
 
         return self._node
 
+    def _set_node(self, node: str) -> None:
+        """Changes node identifier, it should not be used after start."""
+
+        self._node = node
+
+        if self._metrics is not None:
+            self._metrics.set_label("node", node)
+
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__} name={self.name} node={self.node}>"
@@ -23,6 +23,7 @@ class StatusCode(Enum):
     UNKNOWN_COMMAND = 2
     BAD_PARAMS = 3
     INTERNAL_ERROR = 4
+    BUSY = 5
 
 
 class MessageType(Enum):
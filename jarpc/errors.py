@@ -21,3 +21,7 @@ class RPCError(Exception):
 
 class RPCParsingError(RPCError):
     """Base class for payload parsing errors."""
+
+
+class RPCBusyError(RPCError):
+    """Client is overloaded and does not accept more calls."""
@@ -0,0 +1,186 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Running blocking commands in thread and process pools.
+
+Commands registered with executor are regular functions called with arguments only,
+request stays in event loop. Process workers receive raw message body and return
+encoded result, so arguments and results cross process boundary once without being
+decoded and encoded again by server.
+"""
+
+import asyncio
+import inspect
+import time
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+from .codecs import get_codec
+from .protocol import decode_body
+
+__all__ = (
+    "THREAD",
+    "PROCESS",
+    "BadArguments",
+    "DeadlineExpired",
+    "run_function",
+    "run_encoded",
+    "Executors",
+)
+
+THREAD = "thread"
+PROCESS = "process"
+
+
+class BadArguments(Exception):
+    """Arguments do not match signature of command."""
+
+
+class DeadlineExpired(Exception):
+    """Deadline of request passed before command started."""
+
+
+def _check_deadline(deadline: Optional[float]) -> None:
+    if deadline is not None and deadline <= time.time():
+        raise DeadlineExpired
+
+
+def run_function(
+    fn: Callable[..., Any], data: Dict[str, Any], deadline: Optional[float] = None
+) -> Any:
+    """Calls fn with decoded arguments in worker."""
+
+    _check_deadline(deadline)
+
+    try:
+        inspect.signature(fn).bind(**data)
+    except TypeError as e:
+        raise BadArguments(str(e))
+
+    return fn(**data)
+
+
+def run_encoded(
+    fn: Callable[..., Any],
+    body: bytes,
+    codec: int,
+    compression: int,
+    reply_codec: int,
+    deadline: Optional[float] = None,
+) -> Optional[bytes]:
+    """
+    Decodes arguments, calls fn and encodes result in worker. Returns None if fn
+    returned None. Codecs are passed by id, they should be registered in worker.
+    """
+
+    _check_deadline(deadline)
+
+    result = run_function(fn, decode_body(body, get_codec(codec), compression))
+    if result is None:
+        return None
+
+    return get_codec(reply_codec).encode(result)
+
+
+class Executors:
+    """
+    Executors used by commands of server. Thread and process pools are created on
+    first use and shut down by close, given executor instances are not managed.
+    """
+
+    __slots__ = ("_max_workers", "_pools", "_tasks")
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("max_workers should be >= 1")
+
+        self._max_workers = max_workers
+
+        self._pools: Dict[str, Executor] = {}
+        # submitted unfinished calls by executor label
+        self._tasks: Dict[str, int] = {}
+
+    @staticmethod
+    def check(executor: Union[str, Executor]) -> None:
+        """Raises ValueError if executor is neither Executor nor known pool name."""
+
+        if not isinstance(executor, Executor) and executor not in (THREAD, PROCESS):
+            raise ValueError(
+                f'executor should be "{THREAD}", "{PROCESS}" or Executor instance'
+            )
+
+    def get(self, executor: Union[str, Executor]) -> Executor:
+        if isinstance(executor, Executor):
+            return executor
+
+        pool = self._pools.get(executor)
+        if pool is None:
+            if executor == THREAD:
+                pool = ThreadPoolExecutor(self._max_workers, thread_name_prefix="jarpc")
+            else:
+                pool = ProcessPoolExecutor(self._max_workers)
+
+            self._pools[executor] = pool
+
+        return pool
+
+    async def run(
+        self, executor: Union[str, Executor], fn: Callable[..., Any], *args: Any
+    ) -> Any:
+        """Runs fn in executor. Cancellation cancels calls that did not start yet."""
+
+        label = executor if isinstance(executor, str) else "custom"
+        pool = self.get(executor)
+
+        self._tasks[label] = self._tasks.get(label, 0) + 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        finally:
+            self._tasks[label] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns number of unfinished calls (tasks), workers and calls waiting for
+        worker (queued) by executor. Workers are only known for managed pools.
+        """
+
+        result = {}
+        for label, tasks in self._tasks.items():
+            pool = self._pools.get(label)
+            # stdlib pools keep their size in private attribute
+            workers = 0 if pool is None else getattr(pool, "_max_workers", 0)
+
+            result[label] = {
+                "tasks": tasks,
+                "workers": workers,
+                "queued": max(0, tasks - workers) if workers else 0,
+            }
+
+        return result
+
+    def close(self) -> None:
+        """Shuts down managed pools without waiting for running calls."""
+
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+
+        self._pools.clear()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} pools={list(self._pools)}>"
@@ -0,0 +1,134 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Interceptors of calls and requests.
+
+Interceptors are added to connection and called in order they were added, each of
+them passes control to the next one by calling call_next. Connections without
+interceptors skip this machinery completely.
+"""
+
+import contextvars
+import random
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from .protocol import Frame, TraceContext
+from .request import Request
+
+__all__ = ("current_trace", "CallContext", "Interceptor", "TracingInterceptor")
+
+# trace of request being handled by current task
+current_trace: "contextvars.ContextVar[Optional[TraceContext]]" = (
+    contextvars.ContextVar("jarpc_current_trace", default=None)
+)
+
+
+class CallContext:
+    """
+    Outgoing call. Interceptors are allowed to replace data, trace and deadline before
+    request is sent.
+    """
+
+    __slots__ = ("command_index", "data", "nodes", "mode", "trace", "deadline")
+
+    def __init__(
+        self,
+        command_index: int,
+        data: Dict[str, Any],
+        nodes: Optional[Sequence[str]],
+        mode: str,
+        trace: Optional[TraceContext] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.command_index = command_index
+        self.data = data
+        self.nodes = nodes
+        self.mode = mode
+        self.trace = trace
+        self.deadline = deadline
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} command_index={self.command_index} "
+            f"mode={self.mode} trace={self.trace}>"
+        )
+
+
+class Interceptor:
+    """Base class of interceptors, every method passes control further unchanged."""
+
+    __slots__ = ()
+
+    async def send(
+        self, context: CallContext, call_next: Callable[[CallContext], Awaitable[int]]
+    ) -> int:
+        """Wraps sending of request by client. Returns number of receivers."""
+
+        return await call_next(context)
+
+    def receive(self, frame: Frame) -> Optional[Frame]:
+        """
+        Called for every received message before it is processed. Returning None
+        drops message.
+        """
+
+        return frame
+
+    async def handle(
+        self, request: Request, call_next: Callable[[Request], Awaitable[None]]
+    ) -> None:
+        """Wraps processing of request by server, including sending of responses."""
+
+        await call_next(request)
+
+
+class TracingInterceptor(Interceptor):
+    """
+    Propagates trace context. Calls made while handling request continue its trace,
+    other calls start new trace sampled with sample_rate probability.
+    """
+
+    __slots__ = ("_sample_rate",)
+
+    def __init__(self, sample_rate: float = 1.0):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate should be in range [0, 1]")
+
+        self._sample_rate = sample_rate
+
+    async def send(
+        self, context: CallContext, call_next: Callable[[CallContext], Awaitable[int]]
+    ) -> int:
+        if context.trace is None:
+            parent = current_trace.get()
+            if parent is None:
+                context.trace = TraceContext.new(random.random() < self._sample_rate)
+            else:
+                context.trace = parent.child()
+
+        return await call_next(context)
+
+    async def handle(
+        self, request: Request, call_next: Callable[[Request], Awaitable[None]]
+    ) -> None:
+        token = current_trace.set(request.trace)
+
+        try:
+            await call_next(request)
+        finally:
+            current_trace.reset(token)
@@ -0,0 +1,269 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Multi-process server launcher.
+
+Server runs in single process, launcher starts N worker processes running the same
+server with node ids suffixed by worker number and restarts workers that exit. By
+default every worker is a separate server and receives requests sent to all servers.
+Sharded workers ignore such requests, every call is handled by exactly one worker:
+calls with mode="any" are taken from work queue by free worker, targeted calls go to
+node of worker.
+
+Usage: python -m jarpc serve module:server [--workers 4] [--shard] ...
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import time
+
+from typing import Dict, List, Optional, Sequence
+
+from .server import Server
+
+__all__ = ("load_server", "Supervisor", "main")
+
+log = logging.getLogger(__name__)
+
+
+def load_server(target: str) -> Server:
+    """
+    Imports server from "module:attribute" string. Attribute can also be function
+    returning server, it is called in every worker. Raises ValueError if target is
+    malformed or is not a server.
+    """
+
+    module_name, _, attribute = target.partition(":")
+    if not module_name or not attribute:
+        raise ValueError('target should be in "module:attribute" format')
+
+    try:
+        server = getattr(importlib.import_module(module_name), attribute)
+    except AttributeError:
+        raise ValueError(f"module {module_name} has no attribute {attribute}")
+
+    if not isinstance(server, Server) and callable(server):
+        server = server()
+
+    if not isinstance(server, Server):
+        raise ValueError(f"{target} is not a Server")
+
+    return server
+
+
+def _run_worker(target: str, index: int, redis_address: str, shard: bool) -> None:
+    server = load_server(target)
+    server._set_node(f"{server.node}-{index}")
+
+    if shard:
+        server._broadcasts = False
+
+    async def run() -> None:
+        loop = asyncio.get_running_loop()
+
+        # supervisor stops workers with SIGTERM, SIGINT is sent to whole process
+        # group by terminal
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, server.close)
+
+        await server.start(redis_address)
+
+    asyncio.run(run())
+
+
+class Supervisor:
+    """Runs server in worker processes and restarts workers that exit."""
+
+    __slots__ = (
+        "_target",
+        "_workers",
+        "_redis_address",
+        "_shard",
+        "_restart_delay",
+        "_processes",
+        "_stopping",
+    )
+
+    def __init__(
+        self,
+        target: str,
+        workers: int,
+        redis_address: str = "redis://localhost:6379",
+        shard: bool = False,
+        restart_delay: float = 1.0,
+    ):
+        """
+        target is "module:attribute" string passed to load_server. Workers exiting
+        for any reason are restarted after restart_delay seconds.
+        """
+
+        if workers < 1:
+            raise ValueError("workers should be >= 1")
+
+        if restart_delay < 0:
+            raise ValueError("restart_delay should be >= 0")
+
+        self._target = target
+        self._workers = workers
+        self._redis_address = redis_address
+        self._shard = shard
+        self._restart_delay = restart_delay
+
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        process = multiprocessing.Process(
+            target=_run_worker,
+            args=(self._target, index, self._redis_address, self._shard),
+            name=f"jarpc-worker-{index}",
+        )
+        process.start()
+
+        log.info("started worker %d, pid %d", index, process.pid)
+
+        self._processes[index] = process
+
+    def run(self) -> None:
+        """Runs workers until stop is called or SIGINT or SIGTERM is received."""
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: self.stop())
+
+        for index in range(self._workers):
+            self._spawn(index)
+
+        # worker index -> monotonic time of restart
+        restarts: Dict[int, float] = {}
+
+        try:
+            while not self._stopping:
+                # signals do not interrupt wait, timeout bounds reaction time
+                timeout = 0.5
+                if restarts:
+                    next_restart = min(restarts.values()) - time.monotonic()
+                    timeout = max(0, min(timeout, next_restart))
+
+                multiprocessing.connection.wait(
+                    [p.sentinel for p in self._processes.values()], timeout
+                )
+
+                for index, process in list(self._processes.items()):
+                    if process.is_alive():
+                        continue
+
+                    del self._processes[index]
+
+                    if self._stopping:
+                        break
+
+                    log.warning(
+                        "worker %d exited with code %s, restarting in %s seconds",
+                        index,
+                        process.exitcode,
+                        self._restart_delay,
+                    )
+
+                    restarts[index] = time.monotonic() + self._restart_delay
+
+                now = time.monotonic()
+                for index, restart_at in list(restarts.items()):
+                    if restart_at <= now and not self._stopping:
+                        del restarts[index]
+                        self._spawn(index)
+        finally:
+            self._terminate()
+
+    def stop(self) -> None:
+        """Makes run stop workers and return."""
+
+        self._stopping = True
+
+    def _terminate(self, timeout: float = 10) -> None:
+        for process in self._processes.values():
+            process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for process in self._processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+
+            if process.is_alive():
+                log.warning("worker %s did not stop, killing", process.name)
+                process.kill()
+                process.join()
+
+        self._processes.clear()
+
+    @property
+    def workers(self) -> List[int]:
+        """Pids of running workers."""
+
+        return [p.pid for p in self._processes.values() if p.pid is not None]
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} target={self._target} "
+            f"workers={self._workers} shard={self._shard}>"
+        )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m jarpc serve",
+        description="Runs server in multiple worker processes.",
+    )
+    parser.add_argument("target", help='server to run, "module:attribute"')
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="number of processes"
+    )
+    parser.add_argument("--redis-address", default="redis://localhost:6379")
+    parser.add_argument(
+        "--shard",
+        action="store_true",
+        help="ignore requests sent to all servers, each call is handled by one worker",
+    )
+    parser.add_argument("--restart-delay", type=float, default=1.0)
+    parser.add_argument("--log-level", default="INFO")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+
+    # allows importing modules from working directory like python -m does
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+    # fail early if target is broken instead of restarting workers forever
+    try:
+        load_server(args.target)
+    except (ImportError, ValueError) as e:
+        parser.error(str(e))
+
+    Supervisor(
+        args.target,
+        args.workers,
+        redis_address=args.redis_address,
+        shard=args.shard,
+        restart_delay=args.restart_delay,
+    ).run()
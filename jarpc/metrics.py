@@ -0,0 +1,242 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Connection metrics.
+
+Metrics are disabled by default, connections created with metrics=True record them
+into Metrics registry available as connection.metrics. Values that are cheap to read
+on demand (gauges, connection stats) are collected only when registry is exported.
+"""
+
+import bisect
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+__all__ = ("DEFAULT_BUCKETS", "Histogram", "Metrics")
+
+# seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_Labels = Tuple[Tuple[str, str], ...]
+_Key = Tuple[str, _Labels]
+
+
+class Histogram:
+    """Counts observed values in buckets with given upper bounds."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # last bucket is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Returns (upper bound, number of values <= bound) pairs including +Inf."""
+
+        result = []
+        total = 0
+
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms of connection."""
+
+    __slots__ = (
+        "_labels",
+        "_buckets",
+        "_counters",
+        "_gauges",
+        "_histograms",
+        "_collectors",
+    )
+
+    def __init__(
+        self,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """labels are added to every exported metric."""
+
+        self._labels = dict(labels or {})
+        self._buckets = tuple(buckets)
+
+        self._counters: Dict[_Key, float] = {}
+        self._gauges: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, Histogram] = {}
+
+        self._collectors: List[Callable[["Metrics"], None]] = []
+
+    def set_label(self, name: str, value: str) -> None:
+        """Changes label added to every exported metric."""
+
+        self._labels[name] = value
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> _Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Increments counter."""
+
+        key = self._key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_counter(self, name: str, value: float, **labels: Any) -> None:
+        """Sets counter maintained elsewhere, used by collectors."""
+
+        self._counters[self._key(name, labels)] = value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Records value in histogram."""
+
+        key = self._key(name, labels)
+
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self._buckets)
+
+        histogram.observe(value)
+
+    def add_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        """Adds function called before export to update gauges and counters."""
+
+        self._collectors.append(collector)
+
+    def _collect(self) -> None:
+        for collector in self._collectors:
+            collector(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns metrics as dict with counters, gauges and histograms keys. Each of
+        them maps metric name to list of dicts with labels and values.
+        """
+
+        self._collect()
+
+        def values(metrics: Dict[_Key, float]) -> Dict[str, List[Dict[str, Any]]]:
+            result: Dict[str, List[Dict[str, Any]]] = {}
+            for (name, labels), value in metrics.items():
+                result.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+
+            return result
+
+        histograms: Dict[str, List[Dict[str, Any]]] = {}
+        for (name, labels), histogram in self._histograms.items():
+            histograms.setdefault(name, []).append(
+                {
+                    "labels": dict(labels),
+                    "buckets": histogram.cumulative(),
+                    "sum": histogram.sum,
+                    "count": histogram.count,
+                }
+            )
+
+        return {
+            "labels": dict(self._labels),
+            "counters": values(self._counters),
+            "gauges": values(self._gauges),
+            "histograms": histograms,
+        }
+
+    def prometheus(self, prefix: str = "jarpc") -> str:
+        """Returns metrics in Prometheus text exposition format."""
+
+        self._collect()
+
+        lines: List[str] = []
+
+        def add(kind: str, metrics: Dict[_Key, Any]) -> None:
+            seen = set()
+
+            for name, labels in sorted(metrics):
+                full_name = f"{prefix}_{name}"
+                if full_name not in seen:
+                    seen.add(full_name)
+                    lines.append(f"# TYPE {full_name} {kind}")
+
+                value = metrics[(name, labels)]
+
+                if kind != "histogram":
+                    lines.append(f"{full_name}{self._format_labels(labels)} {value}")
+                    continue
+
+                for bound, count in value.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = self._format_labels(labels, le=le)
+                    lines.append(f"{full_name}_bucket{bucket_labels} {count}")
+
+                formatted = self._format_labels(labels)
+                lines.append(f"{full_name}_sum{formatted} {value.sum}")
+                lines.append(f"{full_name}_count{formatted} {value.count}")
+
+        add("counter", self._counters)
+        add("gauge", self._gauges)
+        add("histogram", self._histograms)
+
+        return "\n".join(lines) + "\n"
+
+    def _format_labels(self, labels: _Labels, **extra: str) -> str:
+        merged = {**self._labels, **dict(labels), **extra}
+        if not merged:
+            return ""
+
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        pairs = ",".join(f'{k}="{escape(v)}"' for k, v in merged.items())
+
+        return f"{{{pairs}}}"
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} counters={len(self._counters)} "
+            f"gauges={len(self._gauges)} histograms={len(self._histograms)}>"
+        )
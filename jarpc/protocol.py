@@ -0,0 +1,419 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Message framing.
+
+Every message starts with a fixed size header followed by variable length node and
+address fields and an encoded body:
+
+    +---------+------+-------+-------+--------+---------+----------+----------+
+    | version | type | flags | codec | status | command | sequence | node len |
+    |   u8    |  u8  |  u8   |  u8   |   u8   |   i32   |   u32    |    u8    |
+    +---------+------+-------+-------+--------+---------+----------+----------+
+    | address len | node (utf-8) | address (utf-8) | body ...                 |
+    |     u8      |              |                 |                          |
+    +-------------+--------------+-----------------+--------------------------+
+
+All numbers use network byte order. Header is parsed without touching the body, body
+is decoded only when data is accessed.
+
+Lower 2 bits of flags contain id of compression algorithm used for body.
+
+Streamed responses have FLAG_STREAM set and are numbered using sequence field
+starting from 0. Last message of stream has FLAG_END_OF_STREAM set, it has no body
+unless stream was interrupted by error.
+
+Messages with FLAG_TRACE set carry trace context between address and body: 16 byte
+trace id, 8 byte span id and u8 trace flags (bit 0 means trace is sampled).
+
+Requests with FLAG_DEADLINE set carry f64 unix time after which caller no longer waits
+for responses, it follows trace context if both are present. Deadline is absolute, so
+clocks of nodes should be synchronized.
+
+Messages of the first protocol version started with ASCII b"0" (request) or b"1"
+(response) followed by encoded dict, they are still understood.
+"""
+
+import os
+import struct
+
+from typing import Any, Optional, Union
+
+from .codecs import MARSHAL, Codec
+from .compression import NONE, get_compressor
+from .constants import NoValue
+from .enums import MessageType, StatusCode
+from .errors import RPCParsingError
+
+__all__ = (
+    "VERSION",
+    "LEGACY_VERSION",
+    "FLAG_COMPRESSION_MASK",
+    "FLAG_STREAM",
+    "FLAG_END_OF_STREAM",
+    "FLAG_TRACE",
+    "FLAG_DEADLINE",
+    "TraceContext",
+    "Frame",
+    "encode_frame",
+    "encode_legacy_frame",
+    "decode_frame",
+    "decode_body",
+)
+
+VERSION = 2
+LEGACY_VERSION = 1
+
+FLAG_COMPRESSION_MASK = 0b11
+FLAG_STREAM = 1 << 2
+FLAG_END_OF_STREAM = 1 << 3
+FLAG_TRACE = 1 << 4
+FLAG_DEADLINE = 1 << 5
+
+_HEADER = struct.Struct("!BBBBBiIBB")
+_TRACE = struct.Struct("!16s8sB")
+_DEADLINE = struct.Struct("!d")
+
+_legacy_value_to_type = {b"0": MessageType.REQUEST, b"1": MessageType.RESPONSE}
+_legacy_type_to_value = {v: k for k, v in _legacy_value_to_type.items()}
+
+_type_to_value = {MessageType.REQUEST: 1, MessageType.RESPONSE: 2}
+_value_to_type = {v: k for k, v in _type_to_value.items()}
+
+
+class TraceContext:
+    """Identifies trace and span message belongs to."""
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: bytes, span_id: bytes, sampled: bool = True):
+        if len(trace_id) != 16:
+            raise ValueError("trace_id should be 16 bytes long")
+
+        if len(span_id) != 8:
+            raise ValueError("span_id should be 8 bytes long")
+
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @classmethod
+    def new(cls, sampled: bool = True) -> "TraceContext":
+        """Starts new trace."""
+
+        return cls(os.urandom(16), os.urandom(8), sampled)
+
+    def child(self) -> "TraceContext":
+        """Returns context of new span in the same trace."""
+
+        return self.__class__(self.trace_id, os.urandom(8), self.sampled)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, TraceContext):
+            return NotImplemented
+
+        return (self.trace_id, self.span_id, self.sampled) == (
+            other.trace_id,
+            other.span_id,
+            other.sampled,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} trace_id={self.trace_id.hex()} "
+            f"span_id={self.span_id.hex()} sampled={self.sampled}>"
+        )
+
+
+class Frame:
+    """Parsed message. Body is kept encoded."""
+
+    __slots__ = (
+        "version",
+        "message_type",
+        "flags",
+        "codec",
+        "status",
+        "command_index",
+        "sequence",
+        "node",
+        "address",
+        "body",
+        "data",
+        "trace",
+        "deadline",
+    )
+
+    def __init__(
+        self,
+        version: int,
+        message_type: MessageType,
+        flags: int,
+        codec: int,
+        status: StatusCode,
+        command_index: int,
+        sequence: int,
+        node: str,
+        address: Optional[str],
+        body: Union[bytes, memoryview],
+        data: Any = NoValue,
+        trace: Optional[TraceContext] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.version = version
+        self.message_type = message_type
+        self.flags = flags
+        self.codec = codec
+        self.status = status
+        self.command_index = command_index
+        self.sequence = sequence
+        self.node = node
+        self.address = address
+        self.body = body
+
+        # already decoded body, only set for legacy messages
+        self.data = data
+
+        self.trace = trace
+        self.deadline = deadline
+
+    @property
+    def compression(self) -> int:
+        """Id of compression algorithm used for body."""
+
+        return self.flags & FLAG_COMPRESSION_MASK
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} version={self.version} "
+            f"message_type={self.message_type} node={self.node}>"
+        )
+
+
+def encode_frame(
+    message_type: MessageType,
+    *,
+    node: str,
+    address: Optional[str],
+    body: bytes,
+    codec: int = MARSHAL,
+    status: StatusCode = StatusCode.SUCCESS,
+    command_index: int = 0,
+    sequence: int = 0,
+    flags: int = 0,
+    trace: Optional[TraceContext] = None,
+    deadline: Optional[float] = None,
+) -> bytes:
+    """Encodes message. Body should be already encoded with codec."""
+
+    encoded_node = node.encode()
+    encoded_address = b"" if address is None else address.encode()
+
+    if len(encoded_node) > 255:
+        raise ValueError("node should not be longer than 255 bytes")
+
+    if len(encoded_address) > 255:
+        raise ValueError("address should not be longer than 255 bytes")
+
+    if trace is not None:
+        flags |= FLAG_TRACE
+
+    if deadline is not None:
+        flags |= FLAG_DEADLINE
+
+    header = _HEADER.pack(
+        VERSION,
+        _type_to_value[message_type],
+        flags,
+        codec,
+        status.value,
+        command_index,
+        sequence,
+        len(encoded_node),
+        len(encoded_address),
+    )
+
+    if trace is None and deadline is None:
+        return b"".join((header, encoded_node, encoded_address, body))
+
+    parts = [header, encoded_node, encoded_address]
+
+    if trace is not None:
+        parts.append(_TRACE.pack(trace.trace_id, trace.span_id, int(trace.sampled)))
+
+    if deadline is not None:
+        parts.append(_DEADLINE.pack(deadline))
+
+    parts.append(body)
+
+    return b"".join(parts)
+
+
+def encode_legacy_frame(message_type: MessageType, payload: Any, codec: Codec) -> bytes:
+    """Encodes message using first protocol version."""
+
+    return _legacy_type_to_value[message_type] + codec.encode(payload)
+
+
+def decode_frame(msg: bytes, legacy_codec: Codec) -> Frame:
+    """
+    Parses message header. Raises RPCParsingError for malformed messages.
+
+    Messages of first protocol version do not carry codec id, they are decoded
+    completely using legacy_codec.
+    """
+
+    if msg[:1] in _legacy_value_to_type:
+        return _decode_legacy_frame(msg, legacy_codec)
+
+    view = memoryview(msg)
+
+    try:
+        (
+            version,
+            message_type_value,
+            flags,
+            codec,
+            status_value,
+            command_index,
+            sequence,
+            node_len,
+            address_len,
+        ) = _HEADER.unpack_from(view)
+    except struct.error:
+        raise RPCParsingError("message is too short")
+
+    if version != VERSION:
+        raise RPCParsingError(f"unsupported protocol version: {version}")
+
+    message_type = _value_to_type.get(message_type_value)
+    if message_type is None:
+        raise RPCParsingError(f"unknown message type: {message_type_value}")
+
+    try:
+        status = StatusCode(status_value)
+    except ValueError:
+        raise RPCParsingError(f"unknown status: {status_value}")
+
+    node_end = _HEADER.size + node_len
+    address_end = node_end + address_len
+
+    if len(view) < address_end:
+        raise RPCParsingError("message is too short")
+
+    try:
+        node = str(view[_HEADER.size : node_end], "utf-8")
+        address = str(view[node_end:address_end], "utf-8") if address_len else None
+    except UnicodeDecodeError:
+        raise RPCParsingError("bad node or address encoding")
+
+    trace = None
+    body_start = address_end
+
+    if flags & FLAG_TRACE:
+        body_start += _TRACE.size
+
+        if len(view) < body_start:
+            raise RPCParsingError("message is too short")
+
+        trace_id, span_id, trace_flags = _TRACE.unpack_from(view, address_end)
+        trace = TraceContext(trace_id, span_id, bool(trace_flags & 1))
+
+    deadline = None
+
+    if flags & FLAG_DEADLINE:
+        if len(view) < body_start + _DEADLINE.size:
+            raise RPCParsingError("message is too short")
+
+        (deadline,) = _DEADLINE.unpack_from(view, body_start)
+        body_start += _DEADLINE.size
+
+    return Frame(
+        version=version,
+        message_type=message_type,
+        flags=flags,
+        codec=codec,
+        status=status,
+        command_index=command_index,
+        sequence=sequence,
+        node=node,
+        address=address,
+        body=view[body_start:],
+        trace=trace,
+        deadline=deadline,
+    )
+
+
+def _decode_legacy_frame(msg: bytes, codec: Codec) -> Frame:
+    message_type = _legacy_value_to_type[msg[:1]]
+
+    try:
+        payload = codec.decode(msg[1:])
+
+        if message_type == MessageType.REQUEST:
+            return Frame(
+                version=LEGACY_VERSION,
+                message_type=message_type,
+                flags=0,
+                codec=codec.id,
+                status=StatusCode.SUCCESS,
+                command_index=payload["c"],
+                sequence=0,
+                node=payload["n"],
+                address=payload.get("a"),
+                body=b"",
+                data=payload.get("d", {}),
+            )
+
+        return Frame(
+            version=LEGACY_VERSION,
+            message_type=message_type,
+            flags=0,
+            codec=codec.id,
+            status=StatusCode(payload["s"]),
+            command_index=0,
+            sequence=0,
+            node=payload["n"],
+            address=payload["a"],
+            body=b"",
+            data=payload.get("d", {}),
+        )
+    except Exception as e:
+        raise RPCParsingError(f"bad legacy message: {e.__class__.__name__}: {e}")
+
+
+def decode_body(
+    body: Union[bytes, memoryview], codec: Optional[Codec], compression: int = NONE
+) -> Any:
+    """
+    Decompresses and decodes message body. Empty body is decoded as empty dict.
+    Raises RPCParsingError if body cannot be decoded or codec is unknown (None).
+    """
+
+    if not body:
+        return {}
+
+    if codec is None:
+        raise RPCParsingError("unsupported codec")
+
+    try:
+        if compression != NONE:
+            body = get_compressor(compression).decompress(body)
+
+        return codec.decode(body)
+    except Exception as e:
+        raise RPCParsingError(f"could not decode body: {e.__class__.__name__}: {e}")
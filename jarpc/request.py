@@ -14,13 +14,17 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import time
 import warnings
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 from .abc import ABCServer
+from .codecs import Codec
+from .compression import NONE, Compressor
 from .constants import NoValue
 from .enums import StatusCode
+from .protocol import VERSION, Frame, TraceContext, decode_body
 
 
 class Request:
@@ -29,9 +33,18 @@ class Request:
         "server",
         "command_index",
         "node",
-        "_data",
+        "trace",
+        "deadline",
+        "_decoded",
+        "_body",
+        "_codec",
+        "_compression",
+        "_reply_codec",
+        "_reply_compressor",
         "_address",
+        "_version",
         "_reply_called",
+        "_status",
     )
 
     def __init__(
@@ -47,10 +60,24 @@ class Request:
         self.command_index = command_index
         self.node = node
 
-        self._data = data
+        # trace context sent by client, it is attached to responses
+        self.trace: Optional[TraceContext] = None
+        # unix time after which client stops waiting for responses
+        self.deadline: Optional[float] = None
+
+        self._decoded = data
+        self._body: Union[bytes, memoryview] = b""
+        self._codec: Optional[Codec] = None
+        self._compression = NONE
+        self._reply_codec: Optional[Codec] = None
+        self._reply_compressor: Optional[Compressor] = None
+
         self._address = address
+        self._version = VERSION
 
         self._reply_called = False
+        # status of last response, None if request was not answered
+        self._status: Optional[StatusCode] = None
 
     @classmethod
     def from_data(cls, server: ABCServer, payload: Dict[str, Any]) -> "Request":
@@ -62,21 +89,103 @@ class Request:
             address=payload.get("a"),
         )
 
+    @classmethod
+    def from_frame(
+        cls,
+        server: ABCServer,
+        frame: Frame,
+        codec: Optional[Codec],
+        reply_codec: Optional[Codec] = None,
+        reply_compressor: Optional[Compressor] = None,
+    ) -> "Request":
+        """
+        Creates request from parsed message. Body is decoded on first access using
+        codec, None means codec of message is not supported. Responses are encoded
+        with reply_codec and compressed with reply_compressor, defaults of server are
+        used if they are None.
+        """
+
+        request = cls(
+            server=server,
+            command_index=frame.command_index,
+            node=frame.node,
+            data=frame.data,
+            address=frame.address,
+        )
+        request.trace = frame.trace
+        request.deadline = frame.deadline
+        request._body = frame.body
+        request._codec = codec
+        request._compression = frame.compression
+        request._reply_codec = reply_codec
+        request._reply_compressor = reply_compressor
+        request._version = frame.version
+
+        return request
+
+    @property
+    def time_remaining(self) -> Optional[float]:
+        """
+        Seconds left until client stops waiting for responses, negative if deadline
+        passed. None if client did not send deadline.
+        """
+
+        if self.deadline is None:
+            return None
+
+        return self.deadline - time.time()
+
+    @property
+    def _data(self) -> Any:
+        """Command arguments. Raises RPCParsingError if body cannot be decoded."""
+
+        if self._decoded is NoValue:
+            self._decoded = decode_body(self._body, self._codec, self._compression)
+            self._body = b""
+
+        return self._decoded
+
     async def reply(self, data: Any) -> None:
         await self._reply_with_status(data)
 
     async def _reply_with_status(
-        self, data: Any = NoValue, status: StatusCode = StatusCode.SUCCESS
+        self,
+        data: Any = NoValue,
+        status: StatusCode = StatusCode.SUCCESS,
+        *,
+        sequence: Optional[int] = None,
+        end_of_stream: bool = True,
     ) -> None:
-        if self._reply_called:
-            warnings.warn(
-                "Reply function was called already. "
-                "Using it multiple times may cause side effects"
-            )
-        else:
-            self._reply_called = True
-
-        await self.server.reply(address=self._address, data=data, status=status)
+        """
+        Sends response. sequence should only be set for streamed responses, stream
+        is finished by response with end_of_stream set.
+        """
+
+        # streams consist of multiple responses
+        if sequence is None:
+            if self._reply_called:
+                warnings.warn(
+                    "Reply function was called already. "
+                    "Using it multiple times may cause side effects"
+                )
+            else:
+                self._reply_called = True
+
+        if end_of_stream:
+            self._status = status
+
+        await self.server.reply(
+            node=self.node,
+            address=self._address,
+            data=data,
+            status=status,
+            version=self._version,
+            codec=self._reply_codec,
+            compressor=self._reply_compressor,
+            sequence=sequence,
+            end_of_stream=end_of_stream,
+            trace=self.trace,
+        )
 
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__} command_index={self.command_index}>"
@@ -14,19 +14,63 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Union
 
+from .codecs import Codec
+from .compression import NONE
+from .constants import NoValue
 from .enums import StatusCode
+from .protocol import (
+    FLAG_END_OF_STREAM,
+    FLAG_STREAM,
+    Frame,
+    TraceContext,
+    decode_body,
+)
 
 
 class Response:
 
-    __slots__ = ("status", "node", "data", "_address")
+    __slots__ = (
+        "status",
+        "node",
+        "sequence",
+        "end_of_stream",
+        "trace",
+        "_stream",
+        "_decoded",
+        "_body",
+        "_codec",
+        "_compression",
+        "_address",
+    )
 
-    def __init__(self, status: StatusCode, node: str, data: Any, address: str):
+    def __init__(
+        self,
+        status: StatusCode,
+        node: str,
+        data: Any,
+        address: str,
+        sequence: int = 0,
+        end_of_stream: bool = True,
+    ):
         self.status = status
         self.node = node
-        self.data = data
+
+        # position of response in stream, always 0 for regular commands
+        self.sequence = sequence
+        # last response of node, always True for regular commands
+        self.end_of_stream = end_of_stream
+
+        # trace context of request, if it had one
+        self.trace: Optional[TraceContext] = None
+
+        self._stream = False
+
+        self._decoded = data
+        self._body: Union[bytes, memoryview] = b""
+        self._codec: Optional[Codec] = None
+        self._compression = NONE
 
         self._address = address
 
@@ -39,11 +83,57 @@ class Response:
             address=payload["a"],
         )
 
+    @classmethod
+    def from_frame(cls, frame: Frame, codec: Optional[Codec]) -> "Response":
+        """
+        Creates response from parsed message. Body is decoded on first access using
+        codec, None means codec of message is not supported.
+        """
+
+        assert frame.address is not None
+
+        stream = bool(frame.flags & FLAG_STREAM)
+
+        response = cls(
+            status=frame.status,
+            node=frame.node,
+            data=frame.data,
+            address=frame.address,
+            sequence=frame.sequence,
+            end_of_stream=not stream or bool(frame.flags & FLAG_END_OF_STREAM),
+        )
+        response.trace = frame.trace
+        response._stream = stream
+        response._body = frame.body
+        response._codec = codec
+        response._compression = frame.compression
+
+        return response
+
+    @property
+    def _is_stream_end_marker(self) -> bool:
+        """True for message closing successfully finished stream, it has no data."""
+
+        return self._stream and self.end_of_stream and self.status == StatusCode.SUCCESS
+
+    @property
+    def data(self) -> Any:
+        """Response data. Raises RPCParsingError if body cannot be decoded."""
+
+        if self._decoded is NoValue:
+            self._decoded = decode_body(self._body, self._codec, self._compression)
+            self._body = b""
+
+        return self._decoded
+
     def __str__(self) -> str:
         return str(self.data)
 
     def __repr__(self) -> str:
+        # body is not decoded here, repr should work for malformed responses
+        data = "" if self._decoded is NoValue else f" data={self._decoded}"
+
         return (
             f"<{self.__class__.__name__} status={self.status} "
-            f"node={self.node} data={self.data}>"
+            f"node={self.node} address={self._address}{data}>"
         )
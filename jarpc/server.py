@@ -14,45 +14,279 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
+import functools
+import inspect
 import logging
-
-from typing import Any, Callable, Dict, Optional
+import time
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Union,
+)
 
 from .abc import ABCServer
+from .cache import TTLCache, make_key
+from .codecs import Codec, Encoded
+from .compression import Compressor
 from .connection import Connection
 from .constants import NoValue
-from .enums import StatusCode
+from .enums import MessageType, StatusCode
+from .errors import RPCParsingError
+from .executors import (
+    BadArguments,
+    DeadlineExpired,
+    Executors,
+    run_encoded,
+    run_function,
+)
+from .metrics import Metrics
+from .protocol import LEGACY_VERSION, VERSION, Frame, TraceContext
 from .request import Request
 from .types import CommandType
 
 log = logging.getLogger(__name__)
 
 
+async def _resolved(value: Any) -> Any:
+    return value
+
+
+def _memoize(fn: CommandType, cache: TTLCache) -> CommandType:
+    """
+    Wraps command to cache its results by arguments. Concurrent calls with the same
+    arguments wait for the first one instead of running command again.
+    """
+
+    pending: Dict[Any, "asyncio.Future[Any]"] = {}
+
+    async def run(key: Any, coro: Awaitable[Any]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        pending[key] = future
+
+        result = None
+
+        try:
+            result = await coro
+        finally:
+            del pending[key]
+
+            # None means command replied itself, errors are not cached either
+            if result is None:
+                future.set_result(NoValue)
+            else:
+                cache.set(key, result)
+                future.set_result(result)
+
+        return result
+
+    async def wait(
+        future: "asyncio.Future[Any]", request: Request, kwargs: Dict[str, Any]
+    ) -> Any:
+        result = await asyncio.shield(future)
+        if result is NoValue:
+            result = await fn(request, **kwargs)
+
+        return result
+
+    @functools.wraps(fn)
+    def memoized(request: Request, **kwargs: Any) -> Awaitable[Any]:
+        try:
+            key = make_key(kwargs)
+        except TypeError:
+            return fn(request, **kwargs)  # type: ignore
+
+        cached = cache.get(key)
+        if cached is not NoValue:
+            return _resolved(cached)
+
+        future = pending.get(key)
+        if future is not None:
+            return wait(future, request, kwargs)
+
+        # creating coroutine checks arguments, TypeError is reported as BAD_PARAMS
+        return run(key, fn(request, **kwargs))
+
+    return memoized
+
+
 class Server(Connection, ABCServer):
     """Listens for commands from clients and sends responses."""
 
     # NOTE: defining different __slots__ in Client and Server causes error creating
     # Slient
 
-    def __init__(self, *args: Any, **kwargs: Any):
+    def __init__(
+        self,
+        *args: Any,
+        max_concurrency: Optional[int] = 100,
+        max_queued_requests: Optional[int] = None,
+        executor_workers: Optional[int] = None,
+        consume_queue: bool = True,
+        broadcasts: bool = True,
+        **kwargs: Any,
+    ):
+        """
+        max_concurrency limits number of simultaneously running commands, None means
+        unlimited.
+
+        max_queued_requests limits number of requests waiting for free slot when
+        max_concurrency commands are running, requests above this limit are rejected
+        with BUSY status. By default server stops reading new messages until slot is
+        free instead.
+
+        executor_workers is number of workers of thread and process pools used by
+        commands registered with executor, None means defaults of concurrent.futures.
+
+        consume_queue makes server pull requests sent with "any" mode from work queue,
+        this requires additional redis connection with redis transport.
+
+        broadcasts=False makes server ignore requests sent to all servers, only
+        requests sent to its node and requests from work queue are processed. This
+        is used to shard requests between worker processes of launcher.
+        """
+
         super().__init__(*args, **kwargs)
 
-        self._commands: Dict[int, CommandType] = {}
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency should be >= 1")
 
-    def command(self, index: int) -> Callable[[CommandType], None]:
-        """Flask-style decorator used to register commands. Calls register_command."""
+        if max_queued_requests is not None and max_queued_requests < 0:
+            raise ValueError("max_queued_requests should be >= 0")
 
-        def inner(func: CommandType) -> None:
-            self.add_command(index, func)
+        self._commands: Dict[int, CommandType] = {}
+        self._command_semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._command_codecs: Dict[int, Codec] = {}
+        self._command_compressors: Dict[int, Compressor] = {}
+        self._command_caches: Dict[int, TTLCache] = {}
+        self._command_executors: Dict[int, Union[str, Executor]] = {}
+
+        self._executors = Executors(executor_workers)
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        if max_concurrency is not None:
+            self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        # tasks that gave up global slot while waiting for per-command slot
+        self._unslotted: Set["asyncio.Task[None]"] = set()
+
+        self._max_queued_requests = max_queued_requests
+        # requests waiting for free slot
+        self._queued: Set["asyncio.Task[None]"] = set()
+
+        self._consume_queue = consume_queue
+        self._broadcasts = broadcasts
+
+        if self._metrics is not None:
+            self._metrics.add_collector(self._collect_server_metrics)
+
+    def command(
+        self,
+        index: int,
+        max_concurrency: Optional[int] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        cache: Optional[TTLCache] = None,
+        executor: Union[str, Executor, None] = None,
+    ) -> Callable[[CommandType], CommandType]:
+        """
+        Flask-style decorator used to register commands. Calls register_command.
+
+        Function is returned unchanged, commands run in process pool are pickled by
+        reference to module attribute.
+        """
+
+        def inner(func: CommandType) -> CommandType:
+            self.add_command(
+                index,
+                func,
+                max_concurrency=max_concurrency,
+                codec=codec,
+                compression=compression,
+                cache=cache,
+                executor=executor,
+            )
+
+            return func
 
         return inner
 
-    def add_command(self, index: int, fn: CommandType) -> int:
-        """Registers new command. Raises ValueError if index already used."""
+    def add_command(
+        self,
+        index: int,
+        fn: CommandType,
+        max_concurrency: Optional[int] = None,
+        codec: Union[int, str, Codec, None] = None,
+        compression: Union[int, str, Compressor, None] = None,
+        cache: Optional[TTLCache] = None,
+        executor: Union[str, Executor, None] = None,
+    ) -> int:
+        """
+        Registers new command. Raises ValueError if index already used.
+
+        max_concurrency limits number of simultaneously running calls of this command,
+        calls above the limit wait for their turn.
+
+        codec is used to encode responses of this command. By default responses are
+        encoded with the same codec as request.
+
+        compression overrides compression algorithm of server for responses of this
+        command, "none" disables compression.
+
+        cache memoizes results of command by arguments, it should only be used for
+        commands without side effects. Results are not cached if command fails or
+        returns None. Async generator commands cannot be cached.
+
+        executor runs blocking command outside of event loop: "thread" and "process"
+        use pools managed by server, Executor instances are used as is. Such commands
+        should be regular functions accepting arguments without request, returned
+        value is sent as response. Functions run in process pool should be picklable
+        (defined at module level), their arguments are decoded and results encoded
+        in worker process when codecs allow it.
+        """
 
         if index in self._commands:
             raise ValueError("Command with index %d already registered", index)
 
+        if executor is not None:
+            Executors.check(executor)
+
+            if inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn):
+                raise ValueError("commands run in executor should be regular functions")
+
+            if cache is not None:
+                raise ValueError("commands run in executor cannot be cached")
+
+            self._command_executors[index] = executor
+
+        if cache is not None:
+            if inspect.isasyncgenfunction(fn):
+                raise ValueError("async generator commands cannot be cached")
+
+            self._command_caches[index] = cache
+            fn = _memoize(fn, cache)
+
+        if codec is not None:
+            self._command_codecs[index] = self._resolve_codec(codec)
+
+        if compression is not None:
+            self._command_compressors[index] = self._resolve_compressor(compression)
+
+        if max_concurrency is not None:
+            if max_concurrency < 1:
+                raise ValueError("max_concurrency should be >= 1")
+
+            self._command_semaphores[index] = asyncio.Semaphore(max_concurrency)
+
         self._commands[index] = fn
 
         return index
@@ -63,14 +297,241 @@ class Server(Connection, ABCServer):
         if index not in self._commands:
             raise ValueError("Command with index %d is not registered", index)
 
-        return self._commands.pop(index)
+        self._command_semaphores.pop(index, None)
+        self._command_codecs.pop(index, None)
+        self._command_compressors.pop(index, None)
+        self._command_executors.pop(index, None)
+
+        fn = self._commands.pop(index)
+        if self._command_caches.pop(index, None) is not None:
+            fn = fn.__wrapped__
+
+        return fn
+
+    def _channels(self) -> List[str]:
+        # requests are broadcasted to shared channel, targeted requests are sent to
+        # personal channel of server
+        channels = super()._channels()
+        if self._broadcasts:
+            channels.append(self._name)
+
+        return channels + [self._node_channel(self._node)]
+
+    def _start_background_tasks(self) -> List["asyncio.Task[None]"]:
+        tasks = super()._start_background_tasks()
+
+        if self._consume_queue:
+            tasks.append(asyncio.create_task(self._queue_handler()))
+
+        return tasks
+
+    async def _queue_handler(self) -> None:
+        assert self._transport is not None
+
+        while True:
+            # busy servers leave requests to other servers. Slot is not held while
+            # waiting for queue, other requests would not be able to use it
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+                self._semaphore.release()
+
+            try:
+                msg = await self._transport.pop(self._queue_key())
+            except Exception as e:
+                log.debug(f"queue: connection lost: {e}")
+                return
+
+            request = self._request_from_queue(msg)
+            if request is None or self._request_expired(request):
+                continue
+
+            # popped request waits for slot taken by other request meanwhile
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+
+            self._start_request(request)
+
+    def _request_from_queue(self, msg: bytes) -> Optional[Request]:
+        # queued requests go through the same interceptors as published ones
+        frame = self._receive_frame(msg)
+        if frame is None:
+            return None
+
+        if frame.message_type != MessageType.REQUEST:
+            log.warning("ignoring queued message of type %s", frame.message_type)
+            return None
 
-    def _make_request(self, data: Any) -> Optional[Request]:
-        return Request.from_data(self, data)
+        return self._make_request(frame)
+
+    def _make_request(self, frame: Frame) -> Optional[Request]:
+        codec = self._find_codec(frame.codec)
+        reply_codec = self._command_codecs.get(frame.command_index, codec)
+        reply_compressor = self._command_compressors.get(frame.command_index)
+
+        return Request.from_frame(self, frame, codec, reply_codec, reply_compressor)
+
+    def _request_expired(self, request: Request) -> bool:
+        """Checks if client stopped waiting for request, such requests are dropped."""
+
+        if request.deadline is None or request.deadline > time.time():
+            return False
+
+        self._stats["requests_expired"] += 1
+
+        log.debug("dropping expired request for command %d", request.command_index)
+
+        return True
 
     async def _handle_request(self, request: Request) -> None:
+        if self._request_expired(request):
+            return
+
+        if self._semaphore is None:
+            self._start_request(request)
+            return
+
+        if self._max_queued_requests is None or not self._semaphore.locked():
+            # waiting for semaphore here pauses reading new messages until one of
+            # running commands finishes
+            await self._semaphore.acquire()
+            self._start_request(request)
+            return
+
+        if len(self._queued) >= self._max_queued_requests:
+            await self._reject_request(request)
+            return
+
+        task = asyncio.create_task(self._queue_request(request))
+        task.add_done_callback(self._queued.discard)
+
+        self._queued.add(task)
+
+    async def _queue_request(self, request: Request) -> None:
+        assert self._semaphore is not None
+
+        await self._semaphore.acquire()
+
+        # request could expire while waiting for free slot, it is checked before
+        # running command
+        self._start_request(request)
+
+    async def _reject_request(self, request: Request) -> None:
+        self._stats["requests_rejected"] += 1
+
+        log.debug("server is busy, rejecting command %d", request.command_index)
+
+        if self._metrics is not None:
+            self._metrics.inc(
+                "requests_total", command=request.command_index, status="BUSY"
+            )
+
+        await request._reply_with_status(status=StatusCode.BUSY)
+
+    def _start_request(self, request: Request) -> None:
+        # slot of global semaphore should be already acquired
+        task = asyncio.create_task(self._run_request(request))
+        task.add_done_callback(self._request_done)
+
+        self._tasks.add(task)
+
+    def _request_done(self, task: "asyncio.Task[None]") -> None:
+        self._tasks.discard(task)
+
+        if task in self._unslotted:
+            self._unslotted.discard(task)
+        elif self._semaphore is not None:
+            self._semaphore.release()
+
+        if task.cancelled():
+            return
+
+        exc = task.exception()
+        if exc is not None:
+            log.error(
+                "error processing request: %s: %s", exc.__class__.__name__, str(exc)
+            )
+
+    async def _run_request(self, request: Request) -> None:
+        if self._metrics is None:
+            await self._run_command(request)
+            return
+
+        started = time.perf_counter()
+
+        try:
+            await self._run_command(request)
+        finally:
+            # time spent waiting for per-command semaphore is included
+            self._metrics.observe(
+                "command_duration_seconds",
+                time.perf_counter() - started,
+                command=request.command_index,
+            )
+
+            status = "NO_RESPONSE" if request._status is None else request._status.name
+            self._metrics.inc(
+                "requests_total", command=request.command_index, status=status
+            )
+
+    async def _run_command(self, request: Request) -> None:
+        semaphore = self._command_semaphores.get(request.command_index)
+        if semaphore is None:
+            await self._intercept_request(request)
+            return
+
+        if semaphore.locked() and self._semaphore is not None:
+            await self._wait_command_slot(semaphore)
+        else:
+            await semaphore.acquire()
+
+        try:
+            await self._intercept_request(request)
+        finally:
+            semaphore.release()
+
+    async def _wait_command_slot(self, semaphore: asyncio.Semaphore) -> None:
+        """
+        Waits for slot of command without holding global slot, otherwise requests
+        queued behind busy command would block other commands.
+        """
+
+        assert self._semaphore is not None
+
+        task = asyncio.current_task()
+        assert task is not None
+
+        self._semaphore.release()
+        self._unslotted.add(task)
+
+        await semaphore.acquire()
+
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            semaphore.release()
+
+            raise
+
+        self._unslotted.discard(task)
+
+    async def _intercept_request(self, request: Request) -> None:
+        if not self._interceptors:
+            await self._process_request(request)
+            return
+
+        call: Callable[[Request], Awaitable[None]] = self._process_request
+        for interceptor in reversed(self._interceptors):
+            call = functools.partial(interceptor.handle, call_next=call)
+
+        await call(request)
+
+    async def _process_request(self, request: Request) -> None:
         log.info("received command %d", request.command_index)
 
+        # request could expire while waiting for free slot
+        if self._request_expired(request):
+            return
+
         fn = self._commands.get(request.command_index)
         if fn is None:
             log.warning("unknown command %d", request.command_index)
@@ -79,8 +540,25 @@ class Server(Connection, ABCServer):
 
             return
 
+        executor = self._command_executors.get(request.command_index)
+        if executor is not None:
+            await self._run_in_executor(request, fn, executor)
+
+            return
+
         try:
-            command = fn(request, **request._data)
+            data = request._data
+        except RPCParsingError as e:
+            self._stats["parse_errors"] += 1
+
+            log.error("bad payload given to %d: %s", request.command_index, str(e))
+
+            await request._reply_with_status(str(e), StatusCode.BAD_FORMAT)
+
+            return
+
+        try:
+            command = fn(request, **data)
         except TypeError as e:
             log.error("bad arguments given to %d: %s", request.command_index, str(e))
 
@@ -88,6 +566,11 @@ class Server(Connection, ABCServer):
 
             return
 
+        if inspect.isasyncgen(command):
+            await self._stream_results(request, command)
+
+            return
+
         try:
             command_result = await command
         except Exception as e:
@@ -109,18 +592,213 @@ class Server(Connection, ABCServer):
 
         await request.reply(command_result)
 
+    async def _run_in_executor(
+        self, request: Request, fn: CommandType, executor: Union[str, Executor]
+    ) -> None:
+        codec = request._codec
+        reply_codec = request._reply_codec or self._codec
+
+        # process workers decode body and encode result themselves. Library codecs
+        # (ids below 128) are registered in every process, custom ones may be not
+        encoded = (
+            codec is not None
+            and codec.id < 128
+            and reply_codec.id < 128
+            and request._decoded is NoValue
+            and isinstance(self._executors.get(executor), ProcessPoolExecutor)
+        )
+
+        try:
+            if encoded:
+                assert codec is not None
+
+                body = bytes(request._body)
+                request._body = b""
+
+                result = await self._executors.run(
+                    executor,
+                    run_encoded,
+                    fn,
+                    body,
+                    codec.id,
+                    request._compression,
+                    reply_codec.id,
+                    request.deadline,
+                )
+            else:
+                result = await self._executors.run(
+                    executor, run_function, fn, request._data, request.deadline
+                )
+        except RPCParsingError as e:
+            self._stats["parse_errors"] += 1
+
+            log.error("bad payload given to %d: %s", request.command_index, str(e))
+
+            await request._reply_with_status(str(e), StatusCode.BAD_FORMAT)
+
+            return
+        except BadArguments as e:
+            log.error("bad arguments given to %d: %s", request.command_index, str(e))
+
+            await request._reply_with_status(str(e), StatusCode.BAD_PARAMS)
+
+            return
+        except DeadlineExpired:
+            # request expired while waiting for free worker
+            self._stats["requests_expired"] += 1
+
+            return
+        except Exception as e:
+            log.error(
+                "error calling command %d %s: %s",
+                request.command_index,
+                e.__class__.__name__,
+                str(e),
+            )
+
+            await request._reply_with_status(str(e), StatusCode.INTERNAL_ERROR)
+
+            return
+
+        if result is None:
+            return
+
+        await request.reply(Encoded(result) if encoded else result)
+
+    async def _stream_results(
+        self, request: Request, results: AsyncIterator[Any]
+    ) -> None:
+        # every item is sent as soon as it is produced. Waiting for item to be sent
+        # before requesting next one keeps memory usage flat
+        sequence = 0
+
+        try:
+            async for item in results:
+                await request._reply_with_status(
+                    item, sequence=sequence, end_of_stream=False
+                )
+
+                sequence += 1
+        except Exception as e:
+            log.error(
+                "error streaming command %d %s: %s",
+                request.command_index,
+                e.__class__.__name__,
+                str(e),
+            )
+
+            await request._reply_with_status(
+                str(e), StatusCode.INTERNAL_ERROR, sequence=sequence
+            )
+
+            return
+
+        await request._reply_with_status(sequence=sequence)
+
     async def reply(
-        self, *, address: Optional[str], status: StatusCode, data: Any
+        self,
+        *,
+        node: str,
+        address: Optional[str],
+        status: StatusCode,
+        data: Any,
+        version: int = VERSION,
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = None,
+        sequence: Optional[int] = None,
+        end_of_stream: bool = True,
+        trace: Optional[TraceContext] = None,
     ) -> None:
-        """Sends response to address (if address is present)."""
+        """
+        Sends response to address of node (if address is present).
+
+        Nodes using first protocol version only listen to shared channel, version
+        should be set to version of request. Default codec and compressor are used if
+        codec or compressor is None.
+
+        sequence is position of response in stream, it should be None for regular
+        responses. trace is trace context of request.
+        """
 
         if address is None:
             log.debug("no address, unable to respond")
             return
 
-        payload = {"s": status.value, "n": self.node, "a": address}
+        if version == LEGACY_VERSION:
+            # first protocol version has no streams, items are sent as separate
+            # responses
+            if sequence is not None and end_of_stream and data is NoValue:
+                return
+
+            await self._send_legacy_response(address, status, data)
+        else:
+            await self._send_response(
+                node,
+                address,
+                status,
+                data,
+                codec,
+                compressor,
+                sequence=sequence,
+                end_of_stream=end_of_stream,
+                trace=trace,
+            )
+
+    def _collect_server_metrics(self, metrics: Metrics) -> None:
+        metrics.set_gauge("running_commands", len(self._tasks))
+        metrics.set_gauge("queued_requests", len(self._queued))
+
+        for index, cache in self._command_caches.items():
+            metrics.set_gauge("command_cache_size", len(cache), command=index)
+            metrics.set_counter("command_cache_hits_total", cache.hits, command=index)
+            metrics.set_counter(
+                "command_cache_misses_total", cache.misses, command=index
+            )
+            metrics.set_counter(
+                "command_cache_evictions_total", cache.evictions, command=index
+            )
+
+        for label, stats in self._executors.stats().items():
+            metrics.set_gauge("executor_tasks", stats["tasks"], executor=label)
+            metrics.set_gauge("executor_queued", stats["queued"], executor=label)
+            metrics.set_gauge("executor_workers", stats["workers"], executor=label)
+
+    @property
+    def cache_stats(self) -> Dict[int, Dict[str, int]]:
+        """Cache counters of every command with cached results."""
+
+        return {index: cache.stats() for index, cache in self._command_caches.items()}
+
+    @property
+    def executor_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Unfinished calls (tasks), workers and calls waiting for worker (queued) by
+        executor: "thread", "process" or "custom" for Executor instances.
+        """
+
+        return self._executors.stats()
+
+    def close(self) -> None:
+        """
+        Closes connection, cancels running and queued commands and shuts down
+        executor pools.
+        """
+
+        for task in (*self._tasks, *self._queued):
+            task.cancel()
+
+        self._executors.close()
+
+        super().close()
+
+    @property
+    def running_commands(self) -> int:
+        """Amount of commands being processed at the moment."""
+
+        return len(self._tasks)
 
-        if data is not NoValue:
-            payload["d"] = data
+    @property
+    def queued_requests(self) -> int:
+        """Amount of requests waiting for free slot."""
 
-        await self._send_response(payload)
+        return len(self._queued)
@@ -0,0 +1,945 @@
+# jarpc - just another RPC
+# Copyright (C) 2019  Eugene Ershov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Message transports.
+
+RedisTransport is used by default. Transports created by RedisHub share redis
+connections between connections of the same process. LoopbackTransport delivers
+messages between connections of the same process without network, it is useful for
+tests and for measuring overhead of library itself.
+"""
+
+import asyncio
+import collections
+import hashlib
+import logging
+import time
+
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import aioredis
+
+from .abc import ABCTransport
+
+__all__ = (
+    "PUBLISH",
+    "PUSH",
+    "RedisTransport",
+    "RedisHub",
+    "SharedRedisTransport",
+    "LoopbackHub",
+    "LoopbackTransport",
+)
+
+log = logging.getLogger(__name__)
+
+PUBLISH = "publish"
+PUSH = "push"
+
+# seconds between heartbeats of durable nodes, nodes are counted as receivers for
+# 3 intervals after last heartbeat
+STREAM_HEARTBEAT_INTERVAL = 5.0
+
+# time is taken from redis, clocks of nodes may differ. Messages are not added to
+# streams without consumer groups, nobody would read them
+_STREAM_PUBLISH_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    redis.call("XADD", KEYS[1], "MAXLEN", "~", ARGV[2], "*", "m", ARGV[1])
+end
+
+return redis.call("ZCOUNT", KEYS[2], now - tonumber(ARGV[3]), "+inf")
+"""
+
+# groups of nodes missing for longer than ttl are destroyed, stream and set of nodes
+# expire if all nodes are gone
+_STREAM_HEARTBEAT_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local expired = now - tonumber(ARGV[2])
+
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    local stale = redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", expired)
+    for _, node in ipairs(stale) do
+        redis.call("XGROUP", "DESTROY", KEYS[1], node)
+    end
+end
+
+redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", expired)
+redis.call("ZADD", KEYS[2], now, ARGV[1])
+
+local ttl = math.floor(tonumber(ARGV[2]) * 1000)
+redis.call("PEXPIRE", KEYS[1], ttl)
+redis.call("PEXPIRE", KEYS[2], ttl)
+"""
+
+# seconds shared BLPOP of RedisHub blocks, keys of servers that started consuming
+# queue while it blocks are included into the next one
+_QUEUE_POLL_TIMEOUT = 1
+
+_STREAM_PUBLISH_SHA = hashlib.sha1(_STREAM_PUBLISH_SCRIPT.encode()).hexdigest()
+_STREAM_HEARTBEAT_SHA = hashlib.sha1(_STREAM_HEARTBEAT_SCRIPT.encode()).hexdigest()
+
+
+class RedisTransport(ABCTransport):
+    """
+    Delivers messages using redis pub/sub channels.
+
+    In durable mode channels are replaced with streams. Every node reads them using
+    consumer group named after node and acknowledges messages once they are processed,
+    so messages sent while node is reconnecting are not lost. Nodes reading stream
+    send heartbeats to sorted set next to it, number of recently seen nodes is used
+    as number of receivers. Groups of nodes not seen for stream_node_ttl seconds are
+    destroyed, streams expire once all their nodes are gone for this long.
+    """
+
+    __slots__ = (
+        "_address",
+        "_pool_kwargs",
+        "_durable",
+        "_stream_max_len",
+        "_stream_read_count",
+        "_stream_node_ttl",
+        "_node",
+        "_streams",
+        "_pool",
+        "_sub",
+        "_pub",
+        "_queue_conn",
+        "_receiver",
+        "_closed",
+    )
+
+    def __init__(
+        self,
+        address: Union[Tuple[str, int], str],
+        *,
+        durable: bool = False,
+        stream_max_len: int = 10000,
+        stream_read_count: int = 100,
+        stream_node_ttl: float = 3600,
+        **kwargs: Any,
+    ):
+        """kwargs are passed to aioredis.create_pool."""
+
+        if stream_max_len < 1:
+            raise ValueError("stream_max_len should be >= 1")
+
+        if stream_read_count < 1:
+            raise ValueError("stream_read_count should be >= 1")
+
+        if stream_node_ttl < STREAM_HEARTBEAT_INTERVAL * 3:
+            raise ValueError(
+                f"stream_node_ttl should be >= {STREAM_HEARTBEAT_INTERVAL * 3}"
+            )
+
+        self._address = address
+        self._pool_kwargs = kwargs
+
+        self._durable = durable
+        self._stream_max_len = stream_max_len
+        self._stream_read_count = stream_read_count
+        self._stream_node_ttl = stream_node_ttl
+
+        self._node = ""
+        self._streams: List[str] = []
+
+        self._pool: Optional[aioredis.ConnectionsPool] = None
+        self._sub: Optional[aioredis.RedisConnection] = None
+        self._pub: Optional[aioredis.RedisConnection] = None
+        # BLPOP blocks connection, it cannot be shared with publishing
+        self._queue_conn: Optional[aioredis.RedisConnection] = None
+        self._receiver: Optional[aioredis.pubsub.Receiver] = None
+
+        self._closed = False
+
+    def _stream_key(self, channel: str) -> str:
+        """Returns name of stream replacing channel in durable mode."""
+
+        return f"{channel}:stream"
+
+    @staticmethod
+    def _stream_nodes_key(stream: str) -> str:
+        """Returns name of sorted set of nodes reading stream by heartbeat time."""
+
+        return f"{stream}:nodes"
+
+    def _pipeline(self) -> aioredis.commands.Pipeline:
+        return aioredis.Redis(self._pub).pipeline()
+
+    async def connect(self, node: str, channels: List[str]) -> None:
+        self._node = node
+
+        try:
+            if self._pool is None:
+                # third connection is only created by servers consuming work queue
+                self._pool = await aioredis.create_pool(
+                    self._address, minsize=2, maxsize=3, **self._pool_kwargs
+                )
+
+            self._sub = await self._pool.acquire()
+            self._pub = await self._pool.acquire()
+
+            if self._durable:
+                self._streams = [self._stream_key(channel) for channel in channels]
+
+                await self._create_stream_groups()
+                await self._heartbeat()
+            else:
+                self._receiver = aioredis.pubsub.Receiver()
+
+                await self._sub.execute_pubsub(
+                    "SUBSCRIBE",
+                    *[self._receiver.channel(channel) for channel in channels],
+                )
+        except aioredis.ConnectionClosedError as e:
+            self.disconnect()
+
+            raise ConnectionError(str(e))
+
+    async def _create_stream_groups(self) -> None:
+        # every node reads streams using own consumer group, so each node gets every
+        # message. Group remembers position of node between reconnects
+        redis = aioredis.Redis(self._sub)
+
+        for stream in self._streams:
+            try:
+                await redis.xgroup_create(stream, self._node, mkstream=True)
+            except aioredis.ReplyError as e:
+                if not str(e).startswith("BUSYGROUP"):
+                    raise
+
+        for script in (_STREAM_PUBLISH_SCRIPT, _STREAM_HEARTBEAT_SCRIPT):
+            await redis.script_load(script)
+
+    async def _heartbeat(self) -> None:
+        redis = aioredis.Redis(self._sub)
+
+        for stream in self._streams:
+            await redis.evalsha(
+                _STREAM_HEARTBEAT_SHA,
+                keys=[stream, self._stream_nodes_key(stream)],
+                args=[self._node, self._stream_node_ttl],
+            )
+
+    async def messages(self) -> AsyncIterator[bytes]:
+        if self._durable:
+            async for msg in self._stream_messages():
+                yield msg
+
+            return
+
+        assert self._receiver is not None
+
+        while await self._receiver.wait_message():
+            received = await self._receiver.get()
+            if received is None:
+                break
+
+            _, msg = received
+
+            yield msg
+
+    async def _stream_messages(self) -> AsyncIterator[bytes]:
+        redis = aioredis.Redis(self._sub)
+
+        # messages delivered before reconnect, but not acknowledged are read first
+        latest_id = "0"
+        last_heartbeat = time.monotonic()
+
+        while not self._closed:
+            try:
+                if time.monotonic() - last_heartbeat >= STREAM_HEARTBEAT_INTERVAL:
+                    await self._heartbeat()
+                    last_heartbeat = time.monotonic()
+
+                # reading is interrupted to send heartbeats
+                entries = await redis.xread_group(
+                    self._node,
+                    self._node,
+                    self._streams,
+                    timeout=int(STREAM_HEARTBEAT_INTERVAL * 1000),
+                    count=self._stream_read_count,
+                    latest_ids=[latest_id] * len(self._streams),
+                )
+            except (aioredis.ConnectionClosedError, aioredis.ReplyError, OSError):
+                # group might be destroyed, it is created again after reconnect
+                break
+
+            if not entries:
+                # no pending messages left, switching to new messages
+                latest_id = ">"
+                continue
+
+            processed: Dict[bytes, List[bytes]] = {}
+
+            for stream, message_id, fields in entries:
+                msg = fields.get(b"m")
+                if msg is not None:
+                    # generator is resumed after message is processed
+                    yield msg
+
+                processed.setdefault(stream, []).append(message_id)
+
+            try:
+                for stream, message_ids in processed.items():
+                    await redis.xack(stream, self._node, *message_ids)
+            except (aioredis.ConnectionClosedError, OSError):
+                break
+
+    async def send(
+        self, batch: Sequence[Tuple[str, str, bytes]]
+    ) -> List[Union[int, Exception]]:
+        pipe = self._pipeline()
+
+        for command, channel, msg in batch:
+            if command == PUSH:
+                pipe.rpush(channel, msg)
+            elif self._durable:
+                stream = self._stream_key(channel)
+
+                # returns number of nodes reading stream
+                pipe.evalsha(
+                    _STREAM_PUBLISH_SHA,
+                    keys=[stream, self._stream_nodes_key(stream)],
+                    args=[msg, self._stream_max_len, STREAM_HEARTBEAT_INTERVAL * 3],
+                )
+            else:
+                pipe.publish(channel, msg)
+
+        received: List[Union[int, Exception]] = await pipe.execute(
+            return_exceptions=True
+        )
+
+        return received
+
+    async def pop(self, key: str) -> bytes:
+        if self._pool is None:
+            raise ConnectionError("transport is not connected")
+
+        if self._queue_conn is None:
+            self._queue_conn = await self._pool.acquire()
+
+        try:
+            popped = await self._queue_conn.execute("BLPOP", key, 0)
+        except BaseException:
+            # connection might be waiting for BLPOP reply, it cannot be reused
+            self._release_queue_connection()
+
+            raise
+
+        msg: bytes = popped[1]
+
+        return msg
+
+    def _release_queue_connection(self) -> None:
+        if self._queue_conn is None:
+            return
+
+        self._queue_conn.close()
+
+        if self._pool is not None:
+            self._pool.release(self._queue_conn)
+
+        self._queue_conn = None
+
+    def disconnect(self) -> None:
+        self._release_queue_connection()
+
+        for conn in (self._sub, self._pub):
+            if conn is not None and self._pool is not None:
+                self._pool.release(conn)
+
+        self._sub = None
+        self._pub = None
+        self._receiver = None
+
+    def close(self) -> None:
+        self._closed = True
+
+        if self._durable and self._pub is not None and not self._pub.closed:
+            # node stops being counted as receiver at once. Group is kept until
+            # stream_node_ttl passes, node restarted with the same id gets messages
+            # sent meanwhile
+            for stream in self._streams:
+                self._pub.execute(
+                    "ZREM", self._stream_nodes_key(stream), self._node
+                ).add_done_callback(self._node_removed)
+
+        for conn in (self._sub, self._pub, self._queue_conn):
+            if conn is not None:
+                conn.close()
+
+    @staticmethod
+    def _node_removed(fut: "asyncio.Future[Any]") -> None:
+        if not fut.cancelled() and fut.exception() is not None:
+            log.debug(f"could not remove node from stream: {fut.exception()}")
+
+
+def _exact_pattern(channel: str, index: int) -> str:
+    """
+    Returns glob pattern matching only given channel. Patterns with different index
+    are different, index should be less than length of channel.
+    """
+
+    if not 0 <= index < len(channel):
+        raise ValueError("too many subscribers of the same channel")
+
+    parts = []
+
+    for i, char in enumerate(channel):
+        if i == index:
+            parts.append(f"[\\{char}]")
+        elif char in "*?[]\\":
+            parts.append(f"\\{char}")
+        else:
+            parts.append(char)
+
+    return "".join(parts)
+
+
+class RedisHub:
+    """
+    Shares redis connections between transports of the same process.
+
+    All transports created by hub use single subscriber connection read by single task
+    that dispatches messages by channel, and single publisher connection. Work queues
+    of all servers are consumed by single BLPOP connection waiting for several keys,
+    popped requests are handed to servers in order they started waiting.
+
+    Every channel is subscribed once. If several transports subscribe to the same
+    channel, others are subscribed using distinct patterns matching only this channel,
+    so redis still counts each of them as separate receiver.
+    """
+
+    __slots__ = (
+        "_address",
+        "_connection_kwargs",
+        "_lock",
+        "_sub",
+        "_pub",
+        "_receiver",
+        "_reader",
+        "_slots",
+        "_routes",
+        "_subscriptions",
+        "_queue_reader",
+        "_queue_waiters",
+        "_queue_wakeup",
+        "_closed",
+    )
+
+    def __init__(self, address: Union[Tuple[str, int], str], **kwargs: Any):
+        """kwargs are passed to aioredis.create_connection."""
+
+        self._address = address
+        self._connection_kwargs = kwargs
+
+        self._lock: Optional[asyncio.Lock] = None
+
+        self._sub: Optional[aioredis.RedisConnection] = None
+        self._pub: Optional[aioredis.RedisConnection] = None
+        self._receiver: Optional[aioredis.pubsub.Receiver] = None
+        self._reader: Optional["asyncio.Task[None]"] = None
+
+        # channel -> subscription index -> transport, index 0 is plain subscription
+        self._slots: Dict[str, Dict[int, "SharedRedisTransport"]] = {}
+        # (encoded channel or pattern, is pattern) -> transport
+        self._routes: Dict[Tuple[bytes, bool], "SharedRedisTransport"] = {}
+        # transport -> (channel, subscription index) pairs
+        self._subscriptions: Dict["SharedRedisTransport", List[Tuple[str, int]]] = {}
+
+        self._queue_reader: Optional["asyncio.Task[None]"] = None
+        # queue key -> futures of pop calls waiting for request
+        self._queue_waiters: Dict[str, Deque["asyncio.Future[bytes]"]] = {}
+        # set while reader waits for first pop call
+        self._queue_wakeup: Optional["asyncio.Future[None]"] = None
+
+        self._closed = False
+
+    def transport(self) -> "SharedRedisTransport":
+        """Creates transport using connections of hub."""
+
+        return SharedRedisTransport(self)
+
+    def _get_lock(self) -> asyncio.Lock:
+        # lock is created lazily, hub can be created outside of event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        return self._lock
+
+    async def _connect_subscriber(self) -> aioredis.RedisConnection:
+        if self._sub is not None and not self._sub.closed:
+            return self._sub
+
+        self._sub = await aioredis.create_connection(
+            self._address, **self._connection_kwargs
+        )
+        self._receiver = aioredis.pubsub.Receiver(on_close=self._channel_closed)
+        self._reader = asyncio.create_task(self._read(self._receiver))
+
+        return self._sub
+
+    async def _connect_publisher(self) -> aioredis.RedisConnection:
+        if self._closed:
+            raise ConnectionError("hub is closed")
+
+        if self._pub is not None and not self._pub.closed:
+            return self._pub
+
+        async with self._get_lock():
+            if self._closed:
+                raise ConnectionError("hub is closed")
+
+            if self._pub is None or self._pub.closed:
+                self._pub = await aioredis.create_connection(
+                    self._address, **self._connection_kwargs
+                )
+
+        return self._pub
+
+    async def _blocking_connection(self) -> aioredis.RedisConnection:
+        return await aioredis.create_connection(
+            self._address, **self._connection_kwargs
+        )
+
+    async def _pop(self, key: str) -> bytes:
+        if self._closed:
+            raise ConnectionError("hub is closed")
+
+        fut: "asyncio.Future[bytes]" = asyncio.get_running_loop().create_future()
+        self._queue_waiters.setdefault(key, collections.deque()).append(fut)
+
+        if self._queue_reader is None:
+            self._queue_reader = asyncio.create_task(self._read_queues())
+        elif self._queue_wakeup is not None and not self._queue_wakeup.done():
+            self._queue_wakeup.set_result(None)
+
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            # request could be handed over right before cancellation
+            if fut.done() and not fut.cancelled():
+                asyncio.create_task(self._return_popped(key, fut.result()))
+
+            raise
+        finally:
+            waiters = self._queue_waiters.get(key)
+            if waiters is not None:
+                if fut in waiters:
+                    waiters.remove(fut)
+
+                if not waiters:
+                    del self._queue_waiters[key]
+
+    async def _read_queues(self) -> None:
+        conn = None
+
+        try:
+            conn = await self._blocking_connection()
+
+            while True:
+                if not self._queue_waiters:
+                    self._queue_wakeup = asyncio.get_running_loop().create_future()
+                    await self._queue_wakeup
+
+                    continue
+
+                popped = await conn.execute(
+                    "BLPOP", *self._queue_waiters, _QUEUE_POLL_TIMEOUT
+                )
+                if popped is None:
+                    continue
+
+                key, msg = popped
+                key = key.decode()
+
+                for fut in self._queue_waiters.get(key, ()):
+                    if not fut.done():
+                        fut.set_result(msg)
+                        break
+                else:
+                    # waiter was cancelled while BLPOP was running
+                    await self._return_popped(key, msg)
+        except Exception as e:
+            log.debug(f"shared queue connection lost: {e}")
+
+            self._fail_queue_waiters(ConnectionError(str(e)))
+        finally:
+            if conn is not None:
+                conn.close()
+
+            self._queue_wakeup = None
+            if self._queue_reader is asyncio.current_task():
+                self._queue_reader = None
+
+    async def _return_popped(self, key: str, msg: bytes) -> None:
+        try:
+            await (await self._connect_publisher()).execute("LPUSH", key, msg)
+        except Exception as e:
+            log.warning(f"request popped from {key} is lost: {e}")
+
+    def _fail_queue_waiters(self, exc: Exception) -> None:
+        for waiters in self._queue_waiters.values():
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_exception(exc)
+
+    def _channel_closed(
+        self, channel: aioredis.abc.AbcChannel, exc: Optional[Exception] = None
+    ) -> None:
+        # channels are closed one by one on unsubscribe, but all at once when
+        # connection is lost
+        if self._receiver is not None and (self._sub is None or self._sub.closed):
+            self._receiver.stop()
+
+    async def _read(self, receiver: aioredis.pubsub.Receiver) -> None:
+        while await receiver.wait_message():
+            received = await receiver.get()
+            if received is None:
+                break
+
+            channel, msg = received
+            if channel.is_pattern:
+                _, msg = msg
+
+            transport = self._routes.get((channel.name, channel.is_pattern))
+            if transport is not None:
+                transport._deliver(msg)
+
+        if receiver is self._receiver:
+            self._subscriber_lost()
+
+    def _subscriber_lost(self) -> None:
+        log.debug("shared subscriber connection lost")
+
+        self._sub = None
+        self._receiver = None
+        self._reader = None
+
+        transports = list(self._subscriptions)
+
+        self._slots = {}
+        self._routes = {}
+        self._subscriptions = {}
+
+        # transports reconnect after their message iterators end
+        for transport in transports:
+            transport._deliver(None)
+
+    async def _subscribe(
+        self, transport: "SharedRedisTransport", channels: List[str]
+    ) -> None:
+        if self._closed:
+            raise ConnectionError("hub is closed")
+
+        async with self._get_lock():
+            sub = await self._connect_subscriber()
+
+            assert self._receiver is not None
+
+            subscriptions = self._subscriptions.setdefault(transport, [])
+
+            new_channels = []
+            new_patterns = []
+
+            for channel in channels:
+                slots = self._slots.setdefault(channel, {})
+
+                index = 0
+                while index in slots:
+                    index += 1
+
+                if index == 0:
+                    sender = self._receiver.channel(channel)
+                    new_channels.append(sender)
+                else:
+                    sender = self._receiver.pattern(_exact_pattern(channel, index))
+                    new_patterns.append(sender)
+
+                slots[index] = transport
+                subscriptions.append((channel, index))
+                self._routes[(sender.name, sender.is_pattern)] = transport
+
+            if new_channels:
+                await sub.execute_pubsub("SUBSCRIBE", *new_channels)
+
+            if new_patterns:
+                await sub.execute_pubsub("PSUBSCRIBE", *new_patterns)
+
+    def _unsubscribe(self, transport: "SharedRedisTransport") -> None:
+        # commands are written immediately, so they are sent before subscriptions
+        # made after this call
+        subscriptions = self._subscriptions.pop(transport, [])
+
+        channels = []
+        patterns = []
+
+        for channel, index in subscriptions:
+            slots = self._slots[channel]
+            del slots[index]
+
+            if not slots:
+                del self._slots[channel]
+
+            if index == 0:
+                self._routes.pop((channel.encode(), False), None)
+                channels.append(channel)
+            else:
+                pattern = _exact_pattern(channel, index)
+                self._routes.pop((pattern.encode(), True), None)
+                patterns.append(pattern)
+
+        if self._sub is None or self._sub.closed:
+            return
+
+        try:
+            if channels:
+                self._sub.execute_pubsub("UNSUBSCRIBE", *channels).add_done_callback(
+                    self._unsubscribed
+                )
+
+            if patterns:
+                self._sub.execute_pubsub("PUNSUBSCRIBE", *patterns).add_done_callback(
+                    self._unsubscribed
+                )
+        except aioredis.ConnectionClosedError as e:
+            log.debug(f"could not unsubscribe: {e}")
+
+    @staticmethod
+    def _unsubscribed(fut: "asyncio.Future[Any]") -> None:
+        if not fut.cancelled() and fut.exception() is not None:
+            log.debug(f"could not unsubscribe: {fut.exception()}")
+
+    async def _send(
+        self, batch: Sequence[Tuple[str, str, bytes]]
+    ) -> List[Union[int, Exception]]:
+        pipe = aioredis.Redis(await self._connect_publisher()).pipeline()
+
+        for command, channel, msg in batch:
+            if command == PUSH:
+                pipe.rpush(channel, msg)
+            else:
+                pipe.publish(channel, msg)
+
+        results: List[Union[int, Exception]] = await pipe.execute(
+            return_exceptions=True
+        )
+
+        return results
+
+    def close(self) -> None:
+        """Closes connections of hub, transports using it are disconnected."""
+
+        self._closed = True
+
+        for conn in (self._sub, self._pub):
+            if conn is not None:
+                conn.close()
+
+        self._pub = None
+
+        if self._queue_reader is not None:
+            self._queue_reader.cancel()
+            self._queue_reader = None
+
+        self._fail_queue_waiters(ConnectionError("hub is closed"))
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} address={self._address} "
+            f"transports={len(self._subscriptions)} channels={len(self._slots)}>"
+        )
+
+
+class SharedRedisTransport(ABCTransport):
+    """
+    Transport using connections shared through RedisHub. Durable mode is not
+    supported.
+    """
+
+    __slots__ = ("_hub", "_inbox")
+
+    def __init__(self, hub: RedisHub):
+        self._hub = hub
+
+        self._inbox: "Optional[asyncio.Queue[Optional[bytes]]]" = None
+
+    async def connect(self, node: str, channels: List[str]) -> None:
+        self._inbox = asyncio.Queue()
+
+        try:
+            await self._hub._subscribe(self, channels)
+        except aioredis.ConnectionClosedError as e:
+            raise ConnectionError(str(e))
+
+    def _deliver(self, msg: Optional[bytes]) -> None:
+        if self._inbox is not None:
+            self._inbox.put_nowait(msg)
+
+    async def messages(self) -> AsyncIterator[bytes]:
+        assert self._inbox is not None
+
+        while True:
+            msg = await self._inbox.get()
+            if msg is None:
+                break
+
+            yield msg
+
+    async def send(
+        self, batch: Sequence[Tuple[str, str, bytes]]
+    ) -> List[Union[int, Exception]]:
+        return await self._hub._send(batch)
+
+    async def pop(self, key: str) -> bytes:
+        return await self._hub._pop(key)
+
+    def disconnect(self) -> None:
+        self._hub._unsubscribe(self)
+
+    def close(self) -> None:
+        self.disconnect()
+
+        self._deliver(None)
+
+
+class LoopbackHub:
+    """Routes messages between loopback transports using it."""
+
+    __slots__ = ("_subscribers", "_lists", "_waiters")
+
+    def __init__(self) -> None:
+        self._subscribers: Dict[str, Set["LoopbackTransport"]] = {}
+        self._lists: Dict[str, Deque[bytes]] = {}
+        self._waiters: Dict[str, Deque["asyncio.Future[bytes]"]] = {}
+
+    def subscribe(self, transport: "LoopbackTransport", channels: List[str]) -> None:
+        for channel in channels:
+            self._subscribers.setdefault(channel, set()).add(transport)
+
+    def unsubscribe(self, transport: "LoopbackTransport") -> None:
+        for subscribers in self._subscribers.values():
+            subscribers.discard(transport)
+
+    def publish(self, channel: str, msg: bytes) -> int:
+        subscribers = self._subscribers.get(channel, ())
+
+        for transport in subscribers:
+            transport._deliver(msg)
+
+        return len(subscribers)
+
+    def push(self, key: str, msg: bytes) -> int:
+        queue = self._lists.setdefault(key, collections.deque())
+        waiters = self._waiters.get(key)
+
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(msg)
+
+                return len(queue) + 1
+
+        queue.append(msg)
+
+        return len(queue)
+
+    async def pop(self, key: str) -> bytes:
+        queue = self._lists.get(key)
+        if queue:
+            return queue.popleft()
+
+        waiter: "asyncio.Future[bytes]" = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, collections.deque()).append(waiter)
+
+        return await waiter
+
+
+_default_hub = LoopbackHub()
+
+
+class LoopbackTransport(ABCTransport):
+    """
+    Delivers messages to connections of the same process. Connections talk to each
+    other if their transports use the same hub, global hub is used by default.
+    """
+
+    __slots__ = ("_hub", "_inbox")
+
+    def __init__(self, hub: Optional[LoopbackHub] = None):
+        self._hub = _default_hub if hub is None else hub
+
+        self._inbox: "Optional[asyncio.Queue[Optional[bytes]]]" = None
+
+    async def connect(self, node: str, channels: List[str]) -> None:
+        self._inbox = asyncio.Queue()
+
+        self._hub.subscribe(self, channels)
+
+    def _deliver(self, msg: bytes) -> None:
+        if self._inbox is not None:
+            self._inbox.put_nowait(msg)
+
+    async def messages(self) -> AsyncIterator[bytes]:
+        assert self._inbox is not None
+
+        while True:
+            msg = await self._inbox.get()
+            if msg is None:
+                break
+
+            yield msg
+
+    async def send(
+        self, batch: Sequence[Tuple[str, str, bytes]]
+    ) -> List[Union[int, Exception]]:
+        results: List[Union[int, Exception]] = []
+
+        for command, channel, msg in batch:
+            if command == PUSH:
+                results.append(self._hub.push(channel, msg))
+            else:
+                results.append(self._hub.publish(channel, msg))
+
+        return results
+
+    async def pop(self, key: str) -> bytes:
+        return await self._hub.pop(key)
+
+    def disconnect(self) -> None:
+        self._hub.unsubscribe(self)
+
+    def close(self) -> None:
+        self.disconnect()
+
+        if self._inbox is not None:
+            self._inbox.put_nowait(None)
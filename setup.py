@@ -55,6 +55,7 @@ setuptools.setup(
     python_requires=">=3.7",
     packages=setuptools.find_packages(),
     package_data={"jarpc": ["py.typed"]},
+    entry_points={"console_scripts": ["jarpc = jarpc.__main__:main"]},
     license="GPLv3",
     classifiers=classifiers,
 )
@@ -0,0 +1,20 @@
+import asyncio
+
+from jarpc.bench import percentile, run_case
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert percentile(values, 0.5) == 51
+    assert percentile(values, 0.99) == 100
+    assert percentile(values, 1) == 100
+    assert percentile([], 0.5) == 0.0
+
+
+def test_loopback_case():
+    result = asyncio.run(run_case(servers=2, calls=20, concurrency=4))
+
+    assert result["errors"] == 0
+    assert result["calls_per_second"] > 0
+    assert result["bytes_per_call"] > 0
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+from jarpc import Client, Server
+from jarpc.cache import TTLCache, make_key
+from jarpc.constants import NoValue
+from jarpc.transport import LoopbackHub, LoopbackTransport
+
+from .utils import close, start
+
+
+def test_make_key():
+    assert make_key({"a": 1, "b": [1, 2]}) == make_key({"b": [1, 2], "a": 1})
+    assert make_key({"a": 1}) != make_key({"a": True})
+    assert make_key([1, 2]) != make_key((1, 2))
+
+    with pytest.raises(TypeError):
+        make_key({"a": bytearray()})
+
+
+def test_ttl_cache():
+    cache = TTLCache(ttl=0.05, max_size=2)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    # b is least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is NoValue
+
+    time.sleep(0.05)
+    assert cache.get("a") is NoValue
+
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 2, "evictions": 1}
+
+
+def test_client_cache():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        server = Server("example", transport=LoopbackTransport(hub))
+        calls = 0
+
+        @server.command(0)
+        async def lookup(req, key):
+            nonlocal calls
+            calls += 1
+
+            return key
+
+        await start(client, server)
+
+        client.cache_command(0, ttl=10)
+
+        results = []
+        for key in ("a", "a", "b", "a"):
+            results.append([r.data for r in await client.call(0, {"key": key}, 1)])
+
+        client.invalidate_cache(0, {"key": "a"})
+        await client.call(0, {"key": "a"}, 1)
+
+        close(client, server)
+
+        return results, calls, client.cache_stats
+
+    results, calls, stats = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert results == [["a"], ["a"], ["b"], ["a"]]
+    assert calls == 3
+    assert stats[0]["hits"] == 2
@@ -1,5 +1,261 @@
-from jarpc import Client
+import asyncio
+
+import pytest
+
+from jarpc import Client, Server
+from jarpc.transport import LoopbackHub, LoopbackTransport
+
+from .utils import close, start
 
 
 def test_creation():
     assert Client("example")
+
+
+def test_auto_expect_responses():
+    from jarpc import Response, StatusCode
+    from jarpc.client import ResponsesWithTimeout
+
+    async def main():
+        client = Client("example")
+        receivers = asyncio.get_running_loop().create_future()
+        receivers.set_result(2)
+
+        responses = ResponsesWithTimeout(
+            client, "address", 10, "auto", receivers=receivers
+        )
+
+        for node in ("a", "b"):
+            await client._handle_response(
+                Response(StatusCode.SUCCESS, node, None, "address")
+            )
+
+        return await asyncio.wait_for(responses, 1)
+
+    assert [r.node for r in asyncio.run(main())] == ["a", "b"]
+
+
+def test_bad_expect_responses():
+    with pytest.raises(ValueError):
+        Client("example").call(0, timeout=1, expect_responses="all")
+
+
+def test_bad_call_mode():
+    client = Client("example")
+
+    with pytest.raises(ValueError):
+        client.call(0, timeout=1, mode="some")
+
+    with pytest.raises(ValueError):
+        client.call(0, timeout=1, nodes=["a"], mode="any")
+
+
+def test_single_flight():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub), single_flight=True)
+        server = Server("example", transport=LoopbackTransport(hub))
+        calls = 0
+
+        @server.command(0)
+        async def slow(req, key):
+            nonlocal calls
+            calls += 1
+
+            await asyncio.sleep(0.01)
+
+            return key
+
+        await start(client, server)
+
+        results = await asyncio.gather(
+            *[client.call(0, {"key": i % 2}, 1) for i in range(10)]
+        )
+
+        close(client, server)
+
+        return [[r.data for r in responses] for responses in results], calls
+
+    results, calls = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert results == [[0], [1]] * 5
+    assert calls == 2
+
+
+def test_single_flight_cancel():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub), single_flight=True)
+        server = Server("example", transport=LoopbackTransport(hub))
+
+        @server.command(0)
+        async def slow(req):
+            await asyncio.sleep(0.02)
+
+            return "ok"
+
+        await start(client, server)
+
+        kept = asyncio.ensure_future(client.call(0, timeout=1))
+        cancelled = asyncio.ensure_future(client.call(0, timeout=1))
+        await asyncio.sleep(0.01)
+
+        # cancelling one caller does not affect others sharing the call
+        cancelled.cancel()
+
+        results = [r.data for r in await kept]
+        later = [r.data for r in await client.call(0, timeout=1)]
+
+        close(client, server)
+
+        return cancelled.cancelled(), results, later
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == (True, ["ok"], ["ok"])
+
+
+def test_listener_cleanup():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        server = Server("example", transport=LoopbackTransport(hub))
+
+        @server.command(0)
+        async def slow(req, delay):
+            await asyncio.sleep(delay)
+
+            return delay
+
+        await start(client, server)
+
+        timed_out = await client.call(0, {"delay": 0.1}, 0.02)
+        listeners_after_timeout = len(client._listeners)
+
+        async with client.call(0, {"delay": 0}, 1, expect_responses=0) as responses:
+            first = await responses.__anext__()
+
+        listeners_after_close = len(client._listeners)
+
+        await client.call(0, {"delay": 0}, 1)
+        timers_after_response = len(client._timers)
+
+        # response to timed out call arrives
+        await asyncio.sleep(0.15)
+
+        close(client, server)
+
+        return (
+            timed_out,
+            first.data,
+            listeners_after_timeout,
+            listeners_after_close,
+            timers_after_response,
+            client.stats["late_responses"],
+        )
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == ([], 0, 0, 0, 0, 1)
+
+
+def test_max_pending_calls():
+    from jarpc.errors import RPCBusyError
+
+    async def main():
+        hub = LoopbackHub()
+        client = Client(
+            "example",
+            transport=LoopbackTransport(hub),
+            max_pending_calls=2,
+            max_queued_calls=3,
+        )
+        server = Server("example", transport=LoopbackTransport(hub))
+        running = 0
+        max_running = 0
+
+        @server.command(0)
+        async def slow(req):
+            nonlocal running, max_running
+
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+            return "ok"
+
+        await start(client, server)
+
+        results = await asyncio.gather(*[client.call(0, timeout=1) for _ in range(5)])
+
+        calls = [client.call(0, timeout=1) for _ in range(5)]
+
+        try:
+            client.call(0, timeout=1)
+        except RPCBusyError:
+            rejected = True
+
+        listeners = len(client._listeners)
+
+        await asyncio.gather(*calls)
+        await client.wait_for_call_slot()
+
+        close(client, server)
+
+        return (
+            [len(responses) for responses in results],
+            max_running,
+            rejected,
+            listeners,
+        )
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == ([1] * 5, 2, True, 5)
+
+
+class FailingTransport(LoopbackTransport):
+    async def send(self, batch):
+        raise OSError("connection lost")
+
+
+def test_send():
+    from jarpc.errors import RPCBusyError, RPCError
+
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        broken = Client("example", transport=FailingTransport(hub))
+        server = Server("example", transport=LoopbackTransport(hub))
+        received = asyncio.Event()
+
+        @server.command(0)
+        async def notify(req):
+            received.set()
+
+        await start(client, broken, server)
+
+        receivers = await client.send(0)
+        await received.wait()
+
+        with pytest.raises(OSError):
+            await broken.send(0)
+
+        with pytest.raises(OSError):
+            await broken.call(0, timeout=1, wait_sent=True)
+
+        with pytest.raises(OSError):
+            await broken.call(0, wait_sent=True)
+
+        limited = Client("example", transport=LoopbackTransport(hub), max_send_queue=1)
+        limited.call(0)
+
+        # overloaded client rejects calls instead of creating task for each of them
+        with pytest.raises(RPCBusyError):
+            limited.call(0)
+
+        close(limited, client)
+
+        with pytest.raises(RPCError):
+            await client.send(0)
+
+        close(broken, server)
+
+        return receivers
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == 1
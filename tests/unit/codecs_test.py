@@ -0,0 +1,37 @@
+import pytest
+
+from jarpc.codecs import (
+    JSON,
+    MARSHAL,
+    PICKLE,
+    Codec,
+    get_codec,
+    register_codec,
+    registered_codecs,
+)
+
+payload = {"int": 42, "str": "str", "list": [1, 2, 3], "dict": {"a": "b"}}
+
+
+@pytest.mark.parametrize("codec", registered_codecs(), ids=lambda c: c.name)
+def test_roundtrip(codec):
+    encoded = codec.encode(payload)
+
+    assert codec.decode(encoded) == payload
+    assert codec.decode(memoryview(b"__" + encoded)[2:]) == payload
+
+
+def test_builtin_codecs():
+    assert get_codec(MARSHAL) is get_codec("marshal")
+    assert get_codec(PICKLE).name == "pickle"
+    assert get_codec(JSON).name == "json"
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("unknown")
+
+
+def test_register_duplicate():
+    with pytest.raises(ValueError):
+        register_codec(Codec(MARSHAL, "other", lambda b: b, lambda d: d))
@@ -0,0 +1,32 @@
+import pytest
+
+from jarpc.codecs import MARSHAL, get_codec
+from jarpc.compression import NONE, ZLIB, get_compressor, registered_compressors
+from jarpc.protocol import decode_body
+
+data = b"jarpc" * 1000
+
+
+@pytest.mark.parametrize("compressor", registered_compressors(), ids=lambda c: c.name)
+def test_roundtrip(compressor):
+    compressed = compressor.compress(data)
+
+    assert compressor.decompress(compressed) == data
+    assert compressor.decompress(memoryview(compressed)) == data
+
+
+def test_builtin_compressors():
+    assert get_compressor(NONE).name == "none"
+    assert get_compressor("zlib").id == ZLIB
+
+
+def test_unknown_compressor():
+    with pytest.raises(ValueError):
+        get_compressor("unknown")
+
+
+def test_decode_compressed_body():
+    codec = get_codec(MARSHAL)
+    body = get_compressor(ZLIB).compress(codec.encode({"a": 1}))
+
+    assert decode_body(body, codec, ZLIB) == {"a": 1}
@@ -0,0 +1,131 @@
+import asyncio
+
+from jarpc import Client
+from jarpc.transport import LoopbackHub, LoopbackTransport
+
+from .utils import start
+
+
+class RecordingTransport(LoopbackTransport):
+    def __init__(self, hub):
+        super().__init__(hub)
+
+        self.batches = []
+
+    async def send(self, batch):
+        self.batches.append(len(batch))
+
+        return await super().send(batch)
+
+
+async def _client(**kwargs):
+    transport = RecordingTransport(LoopbackHub())
+    client = Client("example", transport=transport, **kwargs)
+
+    await start(client)
+
+    transport.batches.clear()
+
+    return client, transport
+
+
+def test_batching():
+    async def main():
+        client, transport = await _client()
+
+        await asyncio.gather(*[client.send(0) for _ in range(10)])
+
+        batches = transport.batches
+        client.close()
+
+        return batches, client.stats["flushes"], client.stats["messages_sent"]
+
+    # concurrent sends are published with single flush
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == ([10], 1, 10)
+
+
+def test_batch_limits():
+    async def main():
+        sized, sized_transport = await _client(max_batch_size=4)
+
+        await asyncio.gather(*[sized.send(0) for _ in range(10)])
+
+        size = sized.stats["bytes_sent"] // 10
+        sized.close()
+
+        limited, limited_transport = await _client(max_batch_bytes=size * 3)
+
+        await asyncio.gather(*[limited.send(0) for _ in range(10)])
+
+        limited.close()
+
+        return sized_transport.batches, limited_transport.batches
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == ([4, 4, 2], [3, 3, 3, 1])
+
+
+def test_batch_delay():
+    async def main():
+        results = []
+
+        for delay in (0, 0.1):
+            client, transport = await _client(max_batch_delay=delay)
+
+            first = asyncio.create_task(client.send(0))
+            await asyncio.sleep(0.01)
+            await asyncio.gather(first, client.send(0))
+
+            results.append(transport.batches)
+            client.close()
+
+        return results
+
+    # messages sent within delay share batch
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == [[1, 1], [2]]
+
+
+class BlockingTransport(RecordingTransport):
+    def __init__(self, hub):
+        super().__init__(hub)
+
+        self.unblocked = asyncio.Event()
+
+    async def send(self, batch):
+        await self.unblocked.wait()
+
+        return await super().send(batch)
+
+
+def test_cancelled_sender():
+    async def main():
+        transport = BlockingTransport(LoopbackHub())
+        client = Client("example", transport=transport, max_send_queue=1)
+
+        transport.unblocked.set()
+        asyncio.create_task(client.start())
+        await client.wait_until_ready()
+        transport.unblocked.clear()
+
+        # first message is taken by writer, second one fills queue
+        sends = [asyncio.create_task(client.send(0)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        cancelled = asyncio.create_task(client.send(0))
+        stalled = asyncio.create_task(client.send(0))
+        await asyncio.sleep(0)
+
+        waiting = len(client._space_waiters)
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+
+        transport.unblocked.set()
+
+        await asyncio.gather(*sends, stalled)
+        await client.send(0)
+
+        client.close()
+
+        return waiting, cancelled.cancelled(), client.stats["messages_sent"]
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == (2, True, 4)
@@ -6,6 +6,7 @@ all_enumaration_types = [
     StatusCode.UNKNOWN_COMMAND,
     StatusCode.BAD_PARAMS,
     StatusCode.INTERNAL_ERROR,
+    StatusCode.BUSY,
 ]
 
 
@@ -14,7 +15,7 @@ def test_properties_values():
     Should ensure that variables are set to their expected values
     """
 
-    vals = [0, 1, 2, 3, 4]
+    vals = [0, 1, 2, 3, 4, 5]
     for enum in all_enumaration_types:
         assert enum.value == vals[enum.value]
 
@@ -0,0 +1,152 @@
+import asyncio
+
+from jarpc import Client, Server, Slient
+from jarpc.codecs import MARSHAL, get_codec
+from jarpc.enums import MessageType
+from jarpc.interceptors import Interceptor, TracingInterceptor
+from jarpc.protocol import TraceContext, decode_frame, encode_frame
+from jarpc.transport import LoopbackHub, LoopbackTransport
+
+from .utils import close, start
+
+
+def test_trace_encoding():
+    trace = TraceContext.new(sampled=False)
+    encoded = encode_frame(
+        MessageType.REQUEST, node="n", address="a", body=b"x", trace=trace
+    )
+    frame = decode_frame(encoded, get_codec(MARSHAL))
+
+    assert frame.trace == trace
+    assert bytes(frame.body) == b"x"
+
+
+class RecordingInterceptor(Interceptor):
+    def __init__(self):
+        self.events = []
+
+    async def send(self, context, call_next):
+        self.events.append(("send", context.command_index))
+
+        return await call_next(context)
+
+    def receive(self, frame):
+        self.events.append(("receive", frame.message_type))
+
+        # drop requests for command 1
+        if frame.command_index == 1 and frame.message_type == MessageType.REQUEST:
+            return None
+
+        return frame
+
+    async def handle(self, request, call_next):
+        self.events.append(("handle", request.command_index))
+
+        await call_next(request)
+
+
+def test_trace_propagation():
+    async def main():
+        hub = LoopbackHub()
+        recorder = RecordingInterceptor()
+
+        client = Client(
+            "example",
+            transport=LoopbackTransport(hub),
+            interceptors=[TracingInterceptor()],
+        )
+        slient = Slient(
+            "example",
+            node="slient",
+            transport=LoopbackTransport(hub),
+            interceptors=[TracingInterceptor(), recorder],
+        )
+        server = Server(
+            "example",
+            node="server",
+            transport=LoopbackTransport(hub),
+            interceptors=[TracingInterceptor()],
+        )
+
+        traces = {}
+
+        @slient.command(0)
+        async def outer(req):
+            traces["outer"] = req.trace
+
+            await slient.call(1, timeout=1, nodes=["server"])
+
+            return "ok"
+
+        @server.command(1)
+        async def inner(req):
+            traces["inner"] = req.trace
+
+            return "ok"
+
+        await start(client, slient, server)
+
+        responses = await client.call(0, timeout=1, nodes=["slient"])
+        dropped = await client.call(1, timeout=0.1, nodes=["slient"])
+
+        close(client, slient, server)
+
+        return traces, responses, dropped, recorder.events
+
+    traces, responses, dropped, events = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert traces["outer"].trace_id == traces["inner"].trace_id
+    assert traces["outer"].span_id != traces["inner"].span_id
+    assert responses[0].trace == traces["outer"]
+    assert dropped == []
+    assert events == [
+        ("receive", MessageType.REQUEST),
+        ("handle", 0),
+        ("send", 1),
+        ("receive", MessageType.RESPONSE),
+        ("receive", MessageType.REQUEST),
+    ]
+
+
+class DroppingInterceptor(Interceptor):
+    def receive(self, frame):
+        if frame.message_type == MessageType.REQUEST:
+            return None
+
+        return frame
+
+
+def test_queued_requests_intercepted():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        server = Server(
+            "example",
+            transport=LoopbackTransport(hub),
+            interceptors=[DroppingInterceptor()],
+        )
+        calls = 0
+
+        @server.command(0)
+        async def handler(req):
+            nonlocal calls
+
+            calls += 1
+
+            return "ok"
+
+        await start(client, server)
+
+        responses = await client.call(0, timeout=0.1, mode="any")
+        malformed = server._request_from_queue(b"\x02garbage")
+
+        close(client, server)
+
+        return responses, malformed, calls, server.stats
+
+    responses, malformed, calls, stats = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert responses == []
+    assert malformed is None
+    assert calls == 0
+    assert stats["parse_errors"] == 1
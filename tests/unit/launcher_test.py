@@ -0,0 +1,34 @@
+import pytest
+
+from jarpc import Server
+from jarpc.launcher import Supervisor, load_server
+
+server = Server("example", node="worker", metrics=True)
+
+
+def make_server():
+    return Server("example", broadcasts=False)
+
+
+def test_load_server():
+    assert load_server("tests.unit.launcher_test:server") is server
+    assert isinstance(load_server("tests.unit.launcher_test:make_server"), Server)
+
+    for target in ("tests.unit.launcher_test", "tests.unit.launcher_test:missing"):
+        with pytest.raises(ValueError):
+            load_server(target)
+
+    with pytest.raises(ValueError):
+        Supervisor("tests.unit.launcher_test:server", workers=0)
+
+
+def test_worker_channels():
+    worker = make_server()
+    worker._set_node("worker-1")
+
+    assert worker._channels() == ["jarpc:example:worker-1"]
+
+    server._set_node("worker-0")
+
+    assert server.node == "worker-0"
+    assert server.metrics.snapshot()["labels"]["node"] == "worker-0"
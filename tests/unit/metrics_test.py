@@ -0,0 +1,96 @@
+import asyncio
+
+from jarpc import Client, Server
+from jarpc.metrics import Histogram, Metrics
+from jarpc.transport import LoopbackHub, LoopbackTransport
+
+from .utils import close, start
+
+
+def test_histogram():
+    histogram = Histogram((1, 2))
+
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [(1, 2), (2, 3), (float("inf"), 4)]
+    assert histogram.sum == 6
+    assert histogram.count == 4
+
+
+def test_prometheus_format():
+    metrics = Metrics({"node": "a"}, buckets=(1,))
+    metrics.inc("requests_total", command=0, status="SUCCESS")
+    metrics.inc("requests_total", command=0, status="SUCCESS")
+    metrics.add_collector(lambda m: m.set_gauge("running", 3))
+    metrics.observe("duration_seconds", 0.5, command=0)
+
+    assert metrics.prometheus().splitlines() == [
+        "# TYPE jarpc_requests_total counter",
+        'jarpc_requests_total{node="a",command="0",status="SUCCESS"} 2',
+        "# TYPE jarpc_running gauge",
+        'jarpc_running{node="a"} 3',
+        "# TYPE jarpc_duration_seconds histogram",
+        'jarpc_duration_seconds_bucket{node="a",command="0",le="1"} 1',
+        'jarpc_duration_seconds_bucket{node="a",command="0",le="+Inf"} 1',
+        'jarpc_duration_seconds_sum{node="a",command="0"} 0.5',
+        'jarpc_duration_seconds_count{node="a",command="0"} 1',
+    ]
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["counters"]["requests_total"] == [
+        {"labels": {"command": "0", "status": "SUCCESS"}, "value": 2}
+    ]
+    assert snapshot["gauges"]["running"] == [{"labels": {}, "value": 3}]
+
+
+def test_call_metrics():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub), metrics=True)
+        server = Server("example", transport=LoopbackTransport(hub), metrics=True)
+
+        @server.command(0)
+        async def ping(req):
+            return "pong"
+
+        @server.command(1)
+        async def fail(req):
+            raise RuntimeError
+
+        await start(client, server)
+
+        await client.call(0, timeout=1)
+        await client.call(0, timeout=1)
+        await client.call(1, timeout=1)
+
+        # request task finishes right after sending response
+        await asyncio.sleep(0.01)
+
+        snapshots = client.metrics.snapshot(), server.metrics.snapshot()
+
+        close(client, server)
+
+        return snapshots
+
+    client, server = asyncio.run(asyncio.wait_for(main(), 2))
+
+    requests = {
+        (s["labels"]["command"], s["labels"]["status"]): s["value"]
+        for s in server["counters"]["requests_total"]
+    }
+    durations = {
+        h["labels"]["command"]: h["count"]
+        for h in server["histograms"]["command_duration_seconds"]
+    }
+
+    assert requests == {("0", "SUCCESS"): 2, ("1", "INTERNAL_ERROR"): 1}
+    assert durations == {"0": 2, "1": 1}
+
+    assert client["counters"]["calls_total"] == [
+        {"labels": {"command": "0"}, "value": 2},
+        {"labels": {"command": "1"}, "value": 1},
+    ]
+    assert client["gauges"]["listeners"] == [{"labels": {}, "value": 0}]
+    assert server["gauges"]["running_commands"] == [{"labels": {}, "value": 0}]
@@ -0,0 +1,127 @@
+import pytest
+
+from jarpc import Response, StatusCode
+from jarpc.codecs import MARSHAL, MSGPACK, get_codec
+from jarpc.enums import MessageType
+from jarpc.errors import RPCParsingError
+from jarpc.protocol import (
+    LEGACY_VERSION,
+    VERSION,
+    TraceContext,
+    decode_body,
+    decode_frame,
+    encode_frame,
+    encode_legacy_frame,
+)
+
+marshal = get_codec(MARSHAL)
+
+
+def test_request_roundtrip():
+    encoded = encode_frame(
+        MessageType.REQUEST,
+        node="node",
+        address="address",
+        body=marshal.encode({"a": 1}),
+        codec=MARSHAL,
+        command_index=42,
+    )
+    frame = decode_frame(encoded, marshal)
+
+    assert frame.version == VERSION
+    assert frame.message_type == MessageType.REQUEST
+    assert frame.command_index == 42
+    assert frame.node == "node"
+    assert frame.address == "address"
+    assert frame.codec == MARSHAL
+    assert decode_body(frame.body, marshal) == {"a": 1}
+
+
+def test_response_roundtrip():
+    encoded = encode_frame(
+        MessageType.RESPONSE,
+        node="node",
+        address="address",
+        body=b"",
+        status=StatusCode.BAD_PARAMS,
+    )
+    frame = decode_frame(encoded, marshal)
+
+    assert frame.message_type == MessageType.RESPONSE
+    assert frame.status == StatusCode.BAD_PARAMS
+    assert decode_body(frame.body, marshal) == {}
+
+
+def test_no_address():
+    encoded = encode_frame(MessageType.REQUEST, node="node", address=None, body=b"")
+
+    assert decode_frame(encoded, marshal).address is None
+
+
+def test_deadline():
+    trace = TraceContext.new()
+    encoded = encode_frame(
+        MessageType.REQUEST,
+        node="node",
+        address=None,
+        body=marshal.encode({"a": 1}),
+        trace=trace,
+        deadline=1234.5,
+    )
+    frame = decode_frame(encoded, marshal)
+
+    assert frame.trace == trace
+    assert frame.deadline == 1234.5
+    assert decode_body(frame.body, marshal) == {"a": 1}
+
+    encoded = encode_frame(MessageType.REQUEST, node="node", address=None, body=b"")
+
+    assert decode_frame(encoded, marshal).deadline is None
+
+
+def test_legacy_request():
+    payload = {"n": "node", "c": 1, "d": {"a": 1}, "a": "address"}
+    encoded = encode_legacy_frame(MessageType.REQUEST, payload, marshal)
+    frame = decode_frame(encoded, marshal)
+
+    assert frame.version == LEGACY_VERSION
+    assert frame.command_index == 1
+    assert frame.address == "address"
+    assert frame.data == {"a": 1}
+
+
+@pytest.mark.parametrize("msg", [b"", b"\x02\x01", b"\xff" + b"\x00" * 9, b"0garbage"])
+def test_malformed(msg):
+    with pytest.raises(RPCParsingError):
+        decode_frame(msg, marshal)
+
+
+def test_malformed_body():
+    with pytest.raises(RPCParsingError):
+        decode_body(b"garbage", marshal)
+
+
+def test_unsupported_codec():
+    encoded = encode_frame(
+        MessageType.REQUEST, node="node", address=None, body=b"x", codec=MSGPACK
+    )
+    frame = decode_frame(encoded, marshal)
+
+    with pytest.raises(RPCParsingError):
+        decode_body(frame.body, None)
+
+
+def test_malformed_response_repr():
+    encoded = encode_frame(
+        MessageType.RESPONSE,
+        node="node",
+        address="address",
+        body=b"garbage",
+        status=StatusCode.SUCCESS,
+    )
+    response = Response.from_frame(decode_frame(encoded, marshal), marshal)
+
+    assert "node=node address=address" in repr(response)
+
+    with pytest.raises(RPCParsingError):
+        response.data
@@ -0,0 +1,311 @@
+import asyncio
+import time
+
+import pytest
+
+from jarpc import Client, Request, Response, Server
+from jarpc.cache import TTLCache
+from jarpc.codecs import MARSHAL, get_codec
+from jarpc.enums import MessageType, StatusCode
+from jarpc.protocol import decode_frame, encode_frame
+from jarpc.transport import LoopbackHub, LoopbackTransport
+
+from .utils import close, start
+
+
+def _request(server: Server, command_index: int) -> Request:
+    return Request(server, command_index, "test", {}, None)
+
+
+def test_concurrent_dispatch():
+    async def main():
+        server = Server("example", max_concurrency=2)
+        running = 0
+        max_running = 0
+
+        @server.command(0)
+        async def slow(req):
+            nonlocal running, max_running
+
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(5):
+            await server._handle_request(_request(server, 0))
+
+        while server.running_commands:
+            await asyncio.sleep(0.01)
+
+        return max_running
+
+    assert asyncio.run(main()) == 2
+
+
+def test_command_concurrency_limit():
+    async def main():
+        server = Server("example", max_concurrency=None)
+        running = 0
+        max_running = 0
+
+        @server.command(0, max_concurrency=1)
+        async def slow(req):
+            nonlocal running, max_running
+
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(3):
+            await server._handle_request(_request(server, 0))
+
+        while server.running_commands:
+            await asyncio.sleep(0.01)
+
+        return max_running
+
+    assert asyncio.run(main()) == 1
+
+
+def test_command_limit_keeps_global_slots():
+    async def main():
+        server = Server("example", max_concurrency=3)
+        done = []
+
+        @server.command(0, max_concurrency=1)
+        async def slow(req):
+            await asyncio.sleep(0.1)
+
+        @server.command(1)
+        async def fast(req):
+            done.append(time.perf_counter())
+
+        for _ in range(4):
+            await server._handle_request(_request(server, 0))
+
+        started = time.perf_counter()
+        # requests waiting for slot of command 0 do not hold global slots
+        await asyncio.wait_for(server._handle_request(_request(server, 1)), 0.05)
+
+        while server.running_commands:
+            await asyncio.sleep(0.01)
+
+        return done[0] - started, server._semaphore._value
+
+    elapsed, free_slots = asyncio.run(main())
+
+    assert elapsed < 0.05
+    assert free_slots == 3
+
+
+class RecordingServer(Server):
+    """Server that records sent messages instead of publishing them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.sent = []
+
+    async def _send(self, frame, channel):
+        self.sent.append(decode_frame(frame, self._codec))
+
+        return 1
+
+
+def test_streaming_command():
+    async def main():
+        server = RecordingServer("example")
+
+        @server.command(0)
+        async def numbers(req, count):
+            for i in range(count):
+                yield i
+
+        request = Request(server, 0, "test", {"count": 3}, "address")
+        await server._process_request(request)
+
+        return server.sent
+
+    sent = asyncio.run(main())
+    responses = [Response.from_frame(frame, get_codec(MARSHAL)) for frame in sent]
+
+    assert [r.sequence for r in responses] == [0, 1, 2, 3]
+    assert [r.end_of_stream for r in responses] == [False, False, False, True]
+    assert [r.data for r in responses[:3]] == [0, 1, 2]
+    assert responses[3]._is_stream_end_marker
+
+
+def test_memoized_command():
+    async def main():
+        server = RecordingServer("example")
+        calls = 0
+
+        @server.command(0, cache=TTLCache(ttl=60))
+        async def square(req, x):
+            nonlocal calls
+
+            calls += 1
+            await asyncio.sleep(0.01)
+
+            return x * x
+
+        def request(x):
+            return Request(server, 0, "test", {"x": x}, "address")
+
+        await asyncio.gather(*[server._process_request(request(2)) for _ in range(3)])
+        await server._process_request(request(2))
+        await server._process_request(request(3))
+        await server._process_request(Request(server, 0, "test", {}, "address"))
+
+        assert server.remove_command(0).__name__ == "square"
+
+        return calls, server.sent
+
+    calls, sent = asyncio.run(main())
+    responses = [Response.from_frame(frame, get_codec(MARSHAL)) for frame in sent]
+
+    assert calls == 2
+    assert [r.data for r in responses[:5]] == [4, 4, 4, 4, 9]
+    assert responses[5].status == StatusCode.BAD_PARAMS
+
+
+executor_server = RecordingServer("example", executor_workers=1)
+
+
+# process workers find function by module attribute, decorator should keep it
+@executor_server.command(1, executor="process")
+def _square(x):
+    return x * x
+
+
+def test_executor_commands():
+    async def main():
+        server = executor_server
+        server.add_command(0, _square, executor="thread")
+
+        def request(index, **data):
+            encoded = encode_frame(
+                MessageType.REQUEST,
+                node="test",
+                address="address",
+                body=get_codec(MARSHAL).encode(data),
+                command_index=index,
+            )
+
+            return server._make_request(decode_frame(encoded, get_codec(MARSHAL)))
+
+        await server._process_request(request(0, x=2))
+        await server._process_request(request(1, x=3))
+        await server._process_request(request(1, y=3))
+
+        stats = server.executor_stats
+        server.close()
+
+        return server.sent, stats
+
+    sent, stats = asyncio.run(main())
+    responses = [Response.from_frame(frame, get_codec(MARSHAL)) for frame in sent]
+
+    assert [r.data for r in responses[:2]] == [4, 9]
+    assert responses[2].status == StatusCode.BAD_PARAMS
+    assert stats == {
+        "thread": {"tasks": 0, "workers": 1, "queued": 0},
+        "process": {"tasks": 0, "workers": 1, "queued": 0},
+    }
+
+    with pytest.raises(ValueError):
+        Server("example").add_command(0, _square, executor="fiber")
+
+
+def test_expired_request():
+    async def main():
+        server = RecordingServer("example")
+        calls = 0
+
+        @server.command(0)
+        async def remaining(req):
+            nonlocal calls
+
+            calls += 1
+
+            return req.time_remaining
+
+        expired = Request(server, 0, "test", {}, "address")
+        expired.deadline = time.time() - 1
+
+        valid = Request(server, 0, "test", {}, "address")
+        valid.deadline = time.time() + 10
+
+        await server._process_request(expired)
+        await server._process_request(valid)
+
+        return calls, server.sent, server.stats
+
+    calls, sent, stats = asyncio.run(main())
+
+    assert calls == 1
+    assert len(sent) == 1
+    assert 0 < Response.from_frame(sent[0], get_codec(MARSHAL)).data <= 10
+    assert stats["requests_expired"] == 1
+
+
+def test_busy_server():
+    async def main():
+        server = RecordingServer("example", max_concurrency=1, max_queued_requests=1)
+
+        @server.command(0)
+        async def slow(req):
+            await asyncio.sleep(0.01)
+
+            return "ok"
+
+        for _ in range(3):
+            await server._handle_request(Request(server, 0, "test", {}, "address"))
+
+        queued = server.queued_requests
+
+        while server.running_commands or server.queued_requests:
+            await asyncio.sleep(0.01)
+
+        return queued, server.sent, server.stats
+
+    queued, sent, stats = asyncio.run(main())
+    responses = [Response.from_frame(frame, get_codec(MARSHAL)) for frame in sent]
+
+    assert queued == 1
+    assert [r.status for r in responses] == [
+        StatusCode.BUSY,
+        StatusCode.SUCCESS,
+        StatusCode.SUCCESS,
+    ]
+    assert stats["requests_rejected"] == 1
+
+
+def test_queue_keeps_slots():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        server = Server("example", transport=LoopbackTransport(hub), max_concurrency=1)
+
+        @server.command(0)
+        async def ping(req):
+            return "pong"
+
+        await start(client, server)
+
+        # server waiting for queued requests still runs broadcasted ones
+        broadcasted = await client.call(0, timeout=1)
+        results = await asyncio.gather(
+            *[client.call(0, timeout=1, mode=mode) for mode in ("any", "all") * 2]
+        )
+
+        close(client, server)
+
+        return [r.data for r in broadcasted], [[r.data for r in rs] for rs in results]
+
+    broadcasted, results = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert broadcasted == ["pong"]
+    assert results == [["pong"]] * 4
@@ -0,0 +1,291 @@
+import asyncio
+
+import pytest
+
+from jarpc import Client, Server, Slient, StatusCode
+from jarpc.transport import (
+    PUBLISH,
+    PUSH,
+    LoopbackHub,
+    LoopbackTransport,
+    RedisHub,
+    RedisTransport,
+)
+
+from .utils import close, start
+
+
+def _server(hub, node):
+    server = Server("example", node=node, transport=LoopbackTransport(hub))
+
+    @server.command(0)
+    async def ping(req, value=None):
+        return f"{node}: {value}"
+
+    @server.command(1)
+    async def numbers(req, count):
+        for i in range(count):
+            yield i
+
+    return server
+
+
+def test_loopback_call():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        servers = [_server(hub, node) for node in ("a", "b")]
+
+        await start(client, *servers)
+
+        responses = await client.call(0, {"value": 1}, timeout=1)
+        targeted = await client.call(0, timeout=1, nodes=["b"])
+        streamed = await client.call(1, {"count": 3}, timeout=1, nodes=["a"])
+        unknown = await client.call(10, timeout=1, nodes=["a"])
+
+        close(client, *servers)
+
+        return responses, targeted, streamed, unknown
+
+    responses, targeted, streamed, unknown = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert sorted(r.data for r in responses) == ["a: 1", "b: 1"]
+    assert [r.data for r in targeted] == ["b: None"]
+    assert [r.data for r in streamed] == [0, 1, 2]
+    assert [r.status for r in unknown] == [StatusCode.UNKNOWN_COMMAND]
+
+
+def test_loopback_any_mode():
+    async def main():
+        hub = LoopbackHub()
+        client = Client("example", transport=LoopbackTransport(hub))
+        servers = [_server(hub, node) for node in ("a", "b")]
+
+        await start(client, *servers)
+
+        results = await asyncio.gather(
+            *[client.call(0, {"value": i}, timeout=1, mode="any") for i in range(10)]
+        )
+
+        close(client, *servers)
+
+        return results
+
+    results = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert [len(responses) for responses in results] == [1] * 10
+
+
+def test_loopback_slient():
+    async def main():
+        hub = LoopbackHub()
+        slient = Slient("example", node="s", transport=LoopbackTransport(hub))
+        server = _server(hub, "a")
+
+        @slient.command(0)
+        async def ping(req, value=None):
+            return "s"
+
+        await start(slient, server)
+
+        responses = await slient.call(0, timeout=1)
+
+        close(slient, server)
+
+        return responses
+
+    responses = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert [r.data for r in responses] == ["a: None"]
+
+
+def test_redis_address_with_transport():
+    client = Client("example", transport=LoopbackTransport())
+
+    with pytest.raises(ValueError):
+        asyncio.run(client.start(("localhost", 6379)))
+
+
+def test_exact_pattern():
+    from jarpc.transport import _exact_pattern
+
+    assert _exact_pattern("a*", 0) == "[\\a]\\*"
+    assert _exact_pattern("a*", 1) == "a[\\*]"
+    assert len({_exact_pattern("jarpc:name", i) for i in range(10)}) == 10
+
+    with pytest.raises(ValueError):
+        _exact_pattern("a*", 2)
+
+
+class FakePipeline:
+    def __init__(self, results):
+        self.commands = []
+        self.results = results
+
+    def rpush(self, key, msg):
+        self.commands.append(("rpush", key, msg))
+
+    def evalsha(self, digest, keys, args):
+        self.commands.append(("evalsha", *keys, args[0]))
+
+    async def execute(self, return_exceptions=False):
+        return self.results
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.commands = []
+
+    def execute(self, *args):
+        self.commands.append(args)
+
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(1)
+
+        return future
+
+    def close(self):
+        self.closed = True
+
+
+def test_durable_transport():
+    pipe = FakePipeline([2, 1])
+
+    class Transport(RedisTransport):
+        def _pipeline(self):
+            return pipe
+
+    async def main():
+        transport = Transport("redis://localhost", durable=True)
+        transport._node = "n"
+        transport._streams = ["jarpc:a:stream"]
+        transport._pub = FakeConnection()
+
+        received = await transport.send(
+            [(PUBLISH, "jarpc:a", b"m"), (PUSH, "jarpc:a:queue", b"q")]
+        )
+        transport.close()
+
+        return received, transport._pub
+
+    received, connection = asyncio.run(main())
+
+    # receivers are counted by set of nodes sending heartbeats, not by groups
+    assert received == [2, 1]
+    assert pipe.commands == [
+        ("evalsha", "jarpc:a:stream", "jarpc:a:stream:nodes", b"m"),
+        ("rpush", "jarpc:a:queue", b"q"),
+    ]
+    assert connection.commands == [("ZREM", "jarpc:a:stream:nodes", "n")]
+    assert connection.closed
+
+    with pytest.raises(ValueError):
+        RedisTransport("redis://localhost", durable=True, stream_node_ttl=1)
+
+
+class FakeBlockingConnection(FakeConnection):
+    def __init__(self, lists):
+        super().__init__()
+        self.lists = lists
+
+    async def _blpop(self, keys):
+        for key in keys:
+            if self.lists.get(key):
+                return [key.encode(), self.lists[key].pop(0)]
+
+        await asyncio.sleep(0.01)
+
+    def execute(self, command, *args):
+        self.commands.append((command, *args))
+
+        return asyncio.ensure_future(self._blpop(args[:-1]))
+
+
+def test_hub_queues():
+    lists = {}
+    connections = []
+
+    class Hub(RedisHub):
+        async def _blocking_connection(self):
+            connections.append(FakeBlockingConnection(lists))
+
+            return connections[-1]
+
+    async def main():
+        hub = Hub("redis://localhost")
+        first, second = hub.transport(), hub.transport()
+
+        popped = asyncio.gather(first.pop("a:queue"), second.pop("b:queue"))
+        await asyncio.sleep(0.02)
+
+        lists.update({"a:queue": [b"a"], "b:queue": [b"b"]})
+
+        results = await popped
+
+        hub.close()
+
+        with pytest.raises(ConnectionError):
+            await first.pop("a:queue")
+
+        with pytest.raises(ConnectionError):
+            await hub._send([(PUBLISH, "a", b"m")])
+
+        return results
+
+    assert asyncio.run(asyncio.wait_for(main(), 2)) == [b"a", b"b"]
+
+    # queues of all transports are read by single connection
+    assert len(connections) == 1
+    assert ("BLPOP", "a:queue", "b:queue", 1) in connections[0].commands
+    assert connections[0].closed
+
+
+class RecordingHub(LoopbackHub):
+    def __init__(self):
+        super().__init__()
+
+        self.published = []
+
+    def publish(self, channel, msg):
+        receivers = super().publish(channel, msg)
+        self.published.append((channel, receivers))
+
+        return receivers
+
+
+def test_reply_routing():
+    async def main():
+        hub = RecordingHub()
+        clients = [
+            Client("example", node=node, transport=LoopbackTransport(hub))
+            for node in ("a", "b")
+        ]
+        server = _server(hub, "s")
+
+        await start(server, *clients)
+
+        results = await asyncio.gather(
+            *[c.call(0, {"value": c.node}, timeout=1) for c in clients * 2]
+        )
+
+        close(server, *clients)
+
+        return results, hub.published, [c.stats["messages_received"] for c in clients]
+
+    results, published, received = asyncio.run(asyncio.wait_for(main(), 2))
+
+    assert [[r.data for r in responses] for responses in results] == [
+        ["s: a"],
+        ["s: b"],
+    ] * 2
+
+    # requests go to shared channel, responses only to channel of calling node
+    assert sorted(published) == [("jarpc:example", 1)] * 4 + [
+        ("jarpc:example:a", 1),
+        ("jarpc:example:a", 1),
+        ("jarpc:example:b", 1),
+        ("jarpc:example:b", 1),
+    ]
+    assert received == [2, 2]
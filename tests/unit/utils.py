@@ -0,0 +1,14 @@
+import asyncio
+
+
+async def start(*connections):
+    for connection in connections:
+        asyncio.create_task(connection.start())
+
+    for connection in connections:
+        await connection.wait_until_ready()
+
+
+def close(*connections):
+    for connection in connections:
+        connection.close()